@@ -1,6 +1,23 @@
-from zaggregator.procbundle import *
-from zaggregator.proctable import *
-from zaggregator.procmirror import *
-from zaggregator.utils import *
+import importlib
+import importlib.util
 
 name = "zaggregator"
+
+# public names of these modules are available as zaggregator.<name>, the
+# modules are imported on first access, so light entry points like zcheck
+# don't pay for psutil and fuzzywuzzy. Later modules take precedence, as
+# with star imports.
+_modules = "procbundle", "proctable", "procmirror", "utils"
+
+def __getattr__(attr: str):
+    if not attr.startswith("_"):
+        # `from zaggregator import sqlite' asks for the attribute first
+        if importlib.util.find_spec("zaggregator." + attr) is not None:
+            return importlib.import_module("zaggregator." + attr)
+        for modname in reversed(_modules):
+            module = importlib.import_module("zaggregator." + modname)
+            if hasattr(module, attr):
+                # later lookups don't get here
+                globals()[attr] = getattr(module, attr)
+                return globals()[attr]
+    raise AttributeError("module 'zaggregator' has no attribute '{}'".format(attr))
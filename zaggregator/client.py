@@ -1,12 +1,71 @@
 import argparse
 import sys
-from zaggregator import sqlite
-from zaggregator.utils import discovery_json, eprint
+import json
+import socket
+from zaggregator import snapfile
+from zaggregator.output import discovery_json, all_json, eprint
 from zaggregator.config import metrics as checks
+from zaggregator.config import SOCKPATH, SOCK_TIMEOUT, SNAPPATH
+
+def query(line: str, path: str = SOCKPATH) -> str:
+    """
+        Send command to the daemon over UNIX socket and return response
+        line, None if the daemon isn't reachable
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(SOCK_TIMEOUT)
+            sock.connect(path)
+            sock.sendall(line.encode() + b"\n")
+            response = b""
+            while not response.endswith(b"\n"):
+                data = sock.recv(65536)
+                if not data:
+                    return None
+                response += data
+    except OSError:
+        return None
+    return response.decode().rstrip("\n")
+
+def open_db():
+    """
+        Open and return sqlite database module, when the daemon isn't
+        reachable, sqlite isn't imported otherwise
+    """
+    import sqlite3
+    from zaggregator import sqlite
+    try:
+        sqlite.__init__(sqlite.DBPATH, readonly=True)
+    except sqlite3.OperationalError as e:
+        eprint("\tCannot open {}: {}".format(sqlite.DBPATH, e))
+        sys.exit(1)
+    return sqlite
 
 def discover():
     """ Returns bundles list in Zabbix autodiscovery JSON format """
-    print(discovery_json(sqlite.get_bundle_names()))
+    snapshot = snapfile.open_snapshot(SNAPPATH)
+    if snapshot is not None:
+        print(discovery_json(snapshot.names()))
+        return
+    response = query("discover")
+    if response is None:
+        response = discovery_json(open_db().get_bundle_names())
+    print(response)
+
+def all_bundles():
+    """
+        Returns autodiscovery data and all metrics of all current bundles
+        in one JSON document
+    """
+    snapshot = snapfile.open_snapshot(SNAPPATH)
+    if snapshot is not None:
+        print(all_json(snapshot.names(), *snapshot.all(checks)))
+        return
+    response = query("all")
+    if response is None:
+        sqlite = open_db()
+        response = all_json(sqlite.get_bundle_names(), *sqlite.get_all(checks))
+    print(response)
 
 def check(opts):
     """ Returns value for specified bundle and check type """
@@ -16,7 +75,15 @@ def check(opts):
             "\tInvalid check argument: \'{}\'\n\tSupported options are: \'{}\'".format(
             check, "','".join(checks)))
         sys.exit(1)
-    print(sqlite.get(bname, check))
+    snapshot = snapfile.open_snapshot(SNAPPATH)
+    if snapshot is not None:
+        print(snapshot.get(bname, check))
+        return
+    response = query("get {} {}".format(bname, check))
+    if response is None:
+        print(open_db().get(bname, check))
+    else:
+        print(json.loads(response))
 
 def main(*args, **kwargs):
     """ main module """
@@ -26,12 +93,16 @@ def main(*args, **kwargs):
         help="Discover and print out list of bundles in Zabbix autodiscovery JSON format.")
     group.add_argument('-bundle', nargs=2, metavar=("<bundleName>", "<check>"),
         help="Bundle name to check stats on. Check can be one of: pcpu, rss, vms, ctxvol, ctxinvol",)
+    group.add_argument('-all', action='store_true',
+        help="Print out autodiscovery data and all metrics of all bundles in one JSON document.")
     args = parser.parse_args()
 
     if args.discover:
         discover()
     if args.bundle:
         check(args.bundle)
+    if args.all:
+        all_bundles()
 
 
 if __name__ == '__main__':
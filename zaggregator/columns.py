@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import bisect
+import itertools
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# summed per bundle, in the order of ProcBundle.set_stats()
+SUM_COLUMNS = "ctx_vol", "ctx_invol", "vms", "rss", "pcpu"
+# maximum per bundle, stored as <column>_max
+MAX_COLUMNS = "rss", "pcpu"
+
+class ProcColumns:
+    """
+        Process table snapshot stored column-wise in typed arrays, one row
+        per ProcessMirror, with the id of the bundle the row belongs to.
+        Per-bundle stats are computed as group-by reductions over the
+        columns, with numpy when it is installed.
+    """
+    def __init__(self, procs, bundle=None):
+        self.pid = array("q", [ p.pid for p in procs ])
+        self.ppid = array("q", [ p._parent for p in procs ])
+        self.pgid = array("q", [ p._pgid for p in procs ])
+        self.rss = array("q", [ p.rss or 0 for p in procs ])
+        self.vms = array("q", [ p.vms or 0 for p in procs ])
+        self.ctx_vol = array("q", [ p.ctx_vol or 0 for p in procs ])
+        self.ctx_invol = array("q", [ p.ctx_invol or 0 for p in procs ])
+        self.pcpu = array("d", [ p.pcpu or 0.0 for p in procs ])
+        # -1 stands for processes out of any bundle
+        self.bundle = array("q", bundle if bundle is not None else [-1] * len(procs))
+
+    @classmethod
+    def from_groups(cls, groups: [list]):
+        """
+            Returns ProcColumns with processes of i-th group of ProcessMirrors
+            in bundle i, rows are ordered by bundle id. Process listed in
+            several groups gets a row in each of them.
+        """
+        procs = list(itertools.chain.from_iterable(groups))
+        bundle = [ i for i, procs in enumerate(groups) for _ in procs ]
+        return cls(procs, bundle)
+
+    def __len__(self):
+        return len(self.pid)
+
+    def aggregate(self, ngroups: int) -> dict:
+        """
+            Returns {stat: [value per bundle id]} for bundle ids below
+            ngroups, stats are sums of SUM_COLUMNS, <column>_max of
+            MAX_COLUMNS and `nprocs'. Rows are expected to be ordered by
+            bundle id, as from_groups() lays them out.
+        """
+        if numpy is not None:
+            return self._aggregate_numpy(ngroups)
+        return self._aggregate_array(ngroups)
+
+    def _aggregate_numpy(self, ngroups: int) -> dict:
+        bundle = numpy.frombuffer(self.bundle, dtype=numpy.int64)
+        inside = (bundle >= 0) & (bundle < ngroups)
+        bundle = bundle[inside]
+        ret = { "nprocs": numpy.bincount(bundle, minlength=ngroups).tolist() }
+        for name in SUM_COLUMNS:
+            column = numpy.frombuffer(getattr(self, name), dtype=self._dtype(name))[inside]
+            if column.dtype.kind == "f":
+                out = numpy.bincount(bundle, weights=column, minlength=ngroups)
+            else:
+                # bincount weights are float64, integers are summed exactly
+                out = numpy.zeros(ngroups, dtype=numpy.int64)
+                numpy.add.at(out, bundle, column)
+            ret[name] = out.tolist()
+        for name in MAX_COLUMNS:
+            column = numpy.frombuffer(getattr(self, name), dtype=self._dtype(name))[inside]
+            out = numpy.zeros(ngroups, dtype=column.dtype)
+            numpy.maximum.at(out, bundle, column)
+            ret[name + "_max"] = out.tolist()
+        return ret
+
+    def _aggregate_array(self, ngroups: int) -> dict:
+        # rows of the same bundle are contiguous, reduce slices of columns
+        bounds = [ bisect.bisect_left(self.bundle, i) for i in range(ngroups + 1) ]
+        slices = list(zip(bounds, bounds[1:]))
+        ret = { "nprocs": [ e - s for s, e in slices ] }
+        for name in SUM_COLUMNS:
+            column, zero = getattr(self, name), self._zero(name)
+            ret[name] = [ sum(column[s:e], zero) for s, e in slices ]
+        for name in MAX_COLUMNS:
+            column, zero = getattr(self, name), self._zero(name)
+            ret[name + "_max"] = [ max(column[s:e], default=zero) for s, e in slices ]
+        return ret
+
+    def _dtype(self, name: str):
+        return numpy.float64 if getattr(self, name).typecode == "d" else numpy.int64
+
+    def _zero(self, name: str):
+        return 0.0 if getattr(self, name).typecode == "d" else 0
@@ -2,5 +2,47 @@
 # coding: utf-8
 
 DEFAULT_INTERVAL  = 1.0
+# seconds between sampling cycles, cycles start on wall-clock multiples
+# of it
+sample_interval = 29
 metrics = "pcpu", "rss", "vms", "ctx_vol", "ctx_invol"
 interpreters = "python", "perl", "bash", "tcsh", "zsh",
+# number of distinct command lines with cached bundle names
+name_cache_size = 4096
+# number of compared pairs of process names with cached fuzzy match result
+fuzzy_cache_size = 16384
+# number of top bundles stored for each of the metrics
+top_k = 5
+# store sum of all bundles out of top as a bundle named "other / rest"
+top_other = False
+# samples retention, by age in seconds and by number of cycles kept for
+# each bundle, None disables the limit
+retention_max_age = 24 * 60 * 60
+retention_max_cycles = 300
+# seconds between pruning of outdated samples
+prune_interval = 300
+# daemon serves zcheck queries on this UNIX socket
+SOCKPATH = "/var/run/zaggregator/zaggregator.sock"
+# seconds zcheck waits for the daemon before falling back to sqlite
+SOCK_TIMEOUT = 1.0
+# bytes of an incomplete command line the daemon buffers per connection
+# before dropping the connection
+sock_line_max = 4096
+# daemon writes last values of bundles into this file for zcheck
+SNAPPATH = "/var/run/zaggregator/latest.snap"
+# values of bundles not updated for that many seconds aren't returned,
+# cycles are stamped when collection starts, so a healthy daemon's values
+# get up to an interval plus the duration of a cycle old
+STALE_AFTER = 2 * sample_interval
+# push each cycle to Zabbix server/proxy trapper, None disables pushing
+ZABBIX_SERVER = None
+ZABBIX_PORT = 10051
+# host name as configured in Zabbix, defaults to the hostname
+ZABBIX_HOST = None
+# seconds to wait for connection and response of the trapper
+SENDER_TIMEOUT = 5.0
+# cycles kept while the trapper is unavailable, oldest are dropped first
+sender_queue_max = 120
+# seconds between reconnection attempts, doubled up to the maximum
+sender_retry_min = 1.0
+sender_retry_max = 60.0
@@ -2,17 +2,66 @@ import asyncio
 import sys, os
 import zaggregator
 import time
+import logging
+import signal
 import setproctitle
-from zaggregator import sqlite
+from concurrent.futures import ThreadPoolExecutor
+from zaggregator import sqlite, snapfile
+from zaggregator.server import LatestValues, QueryServer
+from zaggregator.sender import ZabbixSender
+from zaggregator.procbundle import name_from_cmdline
+from zaggregator.proctable import top_rows
+from zaggregator.config import sample_interval
+from zaggregator.config import retention_max_age, retention_max_cycles, prune_interval
+from zaggregator.config import SOCKPATH, SNAPPATH, ZABBIX_SERVER
 
 
-if len(sys.argv) > 1:
-    pidfile = sys.argv[1]
-    with open(pidfile, "w") as fd:
-        fd.write(str(os.getpid()))
+delay = sample_interval
+loop = None
+# collection runs in a single worker thread, off the event loop
+executor = None
+# process table lives between cycles and is updated incrementally
+proctable = None
+# future of the collection in progress
+collecting = None
+# last values of bundles served to zcheck over the socket
+latest = LatestValues()
+# pushes cycles to Zabbix trapper if ZABBIX_SERVER is set
+sender = None
 
-delay = 29
-loop = asyncio.get_event_loop()
+class CycleStats:
+    """
+        Timing of sampling cycles, shows how close collection on this
+        host is to the sampling interval
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.cycles = 0
+        self.skipped = 0
+        self.last = None
+        self.max = 0.0
+        self.total = 0.0
+
+    def add(self, elapsed: float):
+        self.cycles += 1
+        self.last = elapsed
+        self.max = max(self.max, elapsed)
+        self.total += elapsed
+
+    def as_dict(self) -> dict:
+        return {
+                "cycles": self.cycles,
+                "skipped": self.skipped,
+                "last": self.last,
+                "max": self.max,
+                "avg": self.total / self.cycles if self.cycles else None,
+                # part of the interval used by the last collection
+                "budget": self.last / self.interval if self.last is not None else None,
+                # hits, misses, maxsize and currsize of bundle naming cache
+                "name_cache": name_from_cmdline.cache_info()._asdict(),
+                }
+
+stats = CycleStats(delay)
 
 def collect_data(bundle) -> (str, int, int, float):
     """  Collect data """
@@ -20,33 +69,130 @@ def collect_data(bundle) -> (str, int, int, float):
             bundle.rss,
             bundle.pcpu)
 
+def next_tick(now: float, interval: float = None) -> float:
+    """
+        Returns wall-clock time of the next interval boundary after `now'
+    """
+    interval = interval or delay
+    return (now // interval + 1) * interval
+
+def schedule(lc) -> None:
+    """
+        Schedule next run of the callback on the next wall-clock boundary,
+        computed from scratch each time, so delays don't accumulate
+    """
+    loop, callback = lc
+    now = time.time()
+    loop.call_at(loop.time() + next_tick(now) - now, callback, lc)
+
+def collect() -> (float, list):
+    """
+        Update process table and return cycle timestamp and top bundles
+        rows, runs in the executor thread
+    """
+    global proctable
+
+    start = time.perf_counter()
+    ts = time.time()
+    try:
+        if proctable is None:
+            proctable = zaggregator.ProcTable()
+        else:
+            proctable.update()
+    except Exception:
+        # table is half-updated, rebuild it from scratch next cycle
+        proctable = None
+        raise
+    rows = top_rows(proctable)
+    stats.add(time.perf_counter() - start)
+    return ts, rows
+
+def store(future) -> None:
+    """
+        Write collected rows into sqlite and the snapshot file and push
+        them to Zabbix trapper, runs in the loop thread
+    """
+    try:
+        ts, rows = future.result()
+    except Exception:
+        logging.exception("sampling cycle failed")
+        return
+    latest.update(ts, rows)
+    # each step fails on its own, the others still get the cycle
+    try:
+        sqlite.add_records(ts, rows)
+    except Exception:
+        logging.exception("storing cycle to %s failed", sqlite.DBPATH)
+    try:
+        snapfile.write(SNAPPATH, ts, latest.bundles)
+    except Exception:
+        logging.exception("writing snapshot %s failed", SNAPPATH)
+    if sender is not None:
+        try:
+            sender.send(ts, latest.names(), latest.all()[1])
+        except Exception:
+            logging.exception("pushing cycle to %s failed", sender.server)
+    logging.debug("cycle took %.3fs, %d bundles stored", stats.last, len(rows))
+
 def zag_sampler_loop(lc):
     """ Main sampler loop """
+    global collecting
+
     loop, callback = lc
+    schedule(lc)
+    if collecting is not None and not collecting.done():
+        stats.skipped += 1
+        logging.warning("previous cycle is still running, skipping cycle "
+                "(last %.3fs, interval %ss)", stats.last or 0.0, delay)
+        return
+    collecting = loop.run_in_executor(executor, collect)
+    collecting.add_done_callback(store)
 
-    loop.call_later(delay, callback, lc)
-    pt = zaggregator.ProcTable()
-    for b in pt.get_top_5s():
-        sqlite.add_record(
-                (
-                    b.bundle_name,
-                    b.rss,
-                    b.vms,
-                    b.ctx_vol,
-                    b.ctx_invol,
-                    b.pcpu,
-                    ))
+def prune_loop(loop) -> None:
+    """
+        Periodically delete outdated samples, runs in the loop thread
+    """
+    loop.call_later(prune_interval, prune_loop, loop)
+    start = time.perf_counter()
+    latest.prune(retention_max_age)
+    deleted = sqlite.prune(max_age=retention_max_age, max_cycles=retention_max_cycles)
+    logging.debug("pruned %d samples in %.3fs", deleted, time.perf_counter() - start)
 
 def start() -> None:
     """
         initialize and start main daemon loop
     """
+    global loop, executor, sender
+
+    if len(sys.argv) > 1:
+        pidfile = sys.argv[1]
+        with open(pidfile, "w") as fd:
+            fd.write(str(os.getpid()))
 
     setproctitle.setproctitle('zaggregator')
-    lc = (loop, callback)
-    loop.call_later(delay, callback, lc)
+    sqlite.__init__(sqlite.DBPATH)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    executor = ThreadPoolExecutor(max_workers=1)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, loop.stop)
+
+    server = QueryServer(latest, stats)
+    loop.run_until_complete(server.start(SOCKPATH))
+    if ZABBIX_SERVER:
+        sender = ZabbixSender(ZABBIX_SERVER)
+    schedule((loop, callback))
+    loop.call_later(prune_interval, prune_loop, loop)
 
-    loop.run_forever()
-    loop.close()
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+        if os.path.exists(SNAPPATH):
+            os.unlink(SNAPPATH)
+        if sender is not None:
+            loop.run_until_complete(sender.close())
+        executor.shutdown(wait=True)
+        loop.close()
 
 callback = zag_sampler_loop
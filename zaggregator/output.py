@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+import sys
+import json
+
+def eprint(*args, **kwargs):
+    """
+        Wrapper around built-in `print' function which allow to print
+        into sys.stderr instead of sys.stdout
+    """
+    print(*args, file=sys.stderr, **kwargs)
+
+def discovery(names) -> dict:
+    """
+        Returns bundle names as Zabbix autodiscovery document
+    """
+    template = { "data" : [ ]}
+    for bn in names:
+        template["data"].append({ "{#PROCGROUP}": bn, })
+    template["data"].append({ "{#PROCGROUP}": 'idle', })
+    return template
+
+def discovery_json(names):
+    """
+        Returns bundle names in Zabbix autodiscovery JSON format
+    """
+    return json.dumps(discovery(names))
+
+def all_json(names, ts, bundles: dict):
+    """
+        Returns JSON document with autodiscovery data for `names', unix
+        time `ts' of the last cycle and {metric: value} of each of
+        current `bundles' for Zabbix dependent items, e.g.
+        $.bundles.nginx.rss
+    """
+    document = discovery(names)
+    document["ts"] = ts
+    document["bundles"] = bundles
+    return json.dumps(document)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+class CpuSampler:
+    """
+        Class keeps cumulative CPU times of processes and the host between
+        sampling cycles and computes CPU percent over the real interval
+        without sleeping
+    """
+    def __init__(self):
+        self._times = {}
+        self._total = None
+
+    def sample(self, records, cpu_total: float, uptime: float) -> dict:
+        """
+            Returns {pid: pcpu} for records, 100.0 means one fully loaded
+            CPU as in psutil.Process.cpu_percent(). Processes seen for the
+            first time get their average CPU percent since start.
+        """
+        times, ret = {}, {}
+        elapsed = cpu_total - self._total if self._total is not None else 0.0
+
+        for r in records:
+            # (pid, start) pair survives pid reuse between cycles
+            key = (r.pid, r.start)
+            times[key] = r.cpu_time
+            prev = self._times.get(key)
+            if prev is not None and elapsed > 0:
+                ret[r.pid] = max(r.cpu_time - prev, 0.0) / elapsed * 100
+            elif uptime > r.start:
+                ret[r.pid] = r.cpu_time / (uptime - r.start) * 100
+            else:
+                ret[r.pid] = 0.0
+
+        self._times, self._total = times, cpu_total
+        return ret
@@ -1,16 +1,74 @@
 #!/usr/bin/env python
 
 import psutil
+import functools
 import logging
 import os
+import sys
 import zaggregator.utils as utils
 from zaggregator.procmirror import ProcessMirror
-from zaggregator.config import metrics, interpreters
+from zaggregator.columns import ProcColumns
+from zaggregator.config import metrics, interpreters, name_cache_size
 
 
+# name of OtherBundle, names from command lines have no whitespace (first
+# word) or no "/" (basename), so it can't be a name of a real bundle
+OTHER_NAME = "other / rest"
+
+# summary stats of a bundle, set by ProcBundle.set_stats()
+STATS = ("ctx_vol", "ctx_invol", "vms", "rss", "pcpu", "nprocs",
+        "rss_max", "pcpu_max")
+
 class EmptyBundle(Exception): pass
 class BadProcess(Exception): pass
 
+@functools.lru_cache(maxsize=name_cache_size)
+def name_from_cmdline(_cmdline: tuple) -> str:
+    """
+        Choses bundle name from command line arguments, leaders of the
+        same bundles keep their command lines between cycles, so results
+        are cached, see name_from_cmdline.cache_info()
+    """
+    _candidate = None
+
+    # zombies and processes which are exiting have no command line
+    if not _cmdline:
+        return "defunct"
+
+    # special case for processes with set-up titles
+    # due some specific behaviour of /proc they are have
+    # empty strings in their cmdargs, for example:
+    # [ 'zaggregator', '', '', '', '' ]
+    # using this behaviour we are identifying such processes
+    # and returning proctitle itself
+    if len(_cmdline) > 1 and len(list(filter(lambda x: x == '', _cmdline))) > 0:
+        if _cmdline[0].find(" ") < 0:
+            _candidate =  _cmdline[0]
+        else:
+            _candidate =  _cmdline[0].split()[0]
+
+        return sys.intern(_candidate.strip(":-"))
+
+    cline = list(filter(lambda x: not x.startswith("-"), _cmdline))
+
+    def not_interpreter(word) -> bool:
+        """ singleton for simplier parsing """
+        for i in interpreters:
+            if word.find(i) > -1:
+                return False
+        return True
+
+    if cline and cline[0].startswith("/"):
+        cline[0] =  os.path.basename(cline[0])
+    out = ":".join(filter(None,filter(not_interpreter, cline)))
+    try:
+        out = out.split()[0].strip(":")[:20]
+    except IndexError:
+        out = os.path.basename(_cmdline[0])
+
+    # bundles and tables of all cycles share one string per name
+    return sys.intern(out)
+
 class ProcBundle:
     """
         Class represents bundle or group of processes associated
@@ -19,6 +77,7 @@ class ProcBundle:
     def __init__(self, proclist, pt=None):
 
         self.proctable = pt
+        self.registered = False
 
         if isinstance(proclist, ProcessMirror):
             self._pgid = proclist._pgid
@@ -34,15 +93,18 @@ class ProcBundle:
             self._pgid = os.getpgid(proclist.pid)
             self.proclist = [ proclist ]
 
+        # pids of own processes for O(1) membership checks
+        self._pids = set(p.pid for p in self.proclist)
+
         proc = self.proclist[0]
         self.leader = proc
 
         while utils.parent_has_single_child(proc):
             if not utils.is_kernel_thread(proc):
                 proc = proc.parent()
-                if proc and not utils.is_kernel_thread(proc) and proc not in self.proctable.bundled():
+                if proc and not utils.is_kernel_thread(proc) and proc.pid not in self._pids \
+                        and not self.proctable.is_bundled(proc):
                     self.append(proc)
-                    self.proctable._clear_expendable()
             else: break
 
         def go_top(proc):
@@ -72,10 +134,10 @@ class ProcBundle:
 
         if lp:
             self.leader = lp
-            children_pids = [ p.pid for p in lp._proc.children(recursive=True) ]
+            children_pids = self.proctable.descendants(lp.pid)
             for p in children_pids:
                 mirror = self.proctable.mirror_by_pid(p)
-                if mirror not in self.proctable.bundled():
+                if mirror.pid not in self._pids and not self.proctable.is_bundled(mirror):
                     self.append(mirror)
 
         self._set_bundle_name()
@@ -89,26 +151,62 @@ class ProcBundle:
             self.bundle_name = self.name_from_cmdargs(self.leader)
         """
 
-        self.ctx_vol = self.get_n_ctx_switches_vol()
-        self.ctx_invol = self.get_n_ctx_switches_invol()
-        self.vms = self.get_memory_info_vms()
-        self.rss = self.get_memory_info_rss()
-        self.pcpu = self.get_cpu_percent()
+    def __getattr__(self, name: str):
+        """
+            Stats of bundles built outside ProcTable, which sets stats of
+            registered bundles all at once, are calculated on first access
+        """
+        if name in STATS:
+            self.update_stats()
+            return self.__dict__[name]
+        raise AttributeError("'ProcBundle' object has no attribute '{}'".format(name))
+
+    def update_stats(self):
+        """
+            (Re)calculate summary stats of the bundle
+        """
+        self.set_stats(ProcColumns(self.proclist, [0] * len(self.proclist)).aggregate(1), 0)
+
+    def set_stats(self, stats: dict, i: int):
+        """
+            Set summary stats of the bundle from i-th group of
+            ProcColumns.aggregate() result
+        """
+        self.ctx_vol = stats["ctx_vol"][i]
+        self.ctx_invol = stats["ctx_invol"][i]
+        self.vms = stats["vms"][i]
+        self.rss = stats["rss"][i]
+        self.pcpu = stats["pcpu"][i]
+        self.nprocs = stats["nprocs"][i]
+        self.rss_max = stats["rss_max"][i]
+        self.pcpu_max = stats["pcpu_max"][i]
+
+    def discard(self, gone: set):
         """
+            Remove ProcessMirrors with id() in `gone' from the bundle,
+            bundle keeps its name even if leader has gone
         """
+        self.proclist = [ p for p in self.proclist if id(p) not in gone ]
+        self._pids = set(p.pid for p in self.proclist)
+        if self.proclist and id(self.leader) in gone:
+            self.leader = self.proclist[0]
 
     def append(self, proc: ProcessMirror):
         """
             Append ProcessMirror to curent ProcBundle's processes list
         """
         self.proclist.append(proc)
+        self._pids.add(proc.pid)
+        if self.registered:
+            self.proctable._mark_bundled(proc, self)
 
     def merge(self, bundle):
         """
             Merge ProcBundle with current one
         """
         self.proclist.extend(bundle.proclist)
-        self.proctable.bundles.remove(bundle)
+        self._pids.update(bundle._pids)
+        self.proctable._merged(bundle, self)
 
     def _set_bundle_name(self):
         """
@@ -142,88 +240,60 @@ class ProcBundle:
             Choses name for the ProcBundle from ProcessMirror's
             command line arguments
         """
-        _candidate = None
-
-        _cmdline = proc._cmdline
         if utils.is_kernel_thread(proc): return "kernel"
-        # special case for processes with set-up titles
-        # due some specific behaviour of /proc they are have
-        # empty strings in their cmdargs, for example:
-        # [ 'zaggregator', '', '', '', '' ]
-        # using this behaviour we are identifying such processes
-        # and returning proctitle itself
-        if len(_cmdline) > 1 and len(list(filter(lambda x: x == '', _cmdline))) > 0:
-            if _cmdline[0].find(" ") < 0:
-                _candidate =  _cmdline[0]
-            else:
-                _candidate =  _cmdline[0].split()[0]
-
-            return _candidate.strip(":-")
-
-        cline = list(filter(lambda x: not x.startswith("-"), _cmdline))
-
-        def not_interpreter(word) -> bool:
-            """ singleton for simplier parsing """
-            for i in interpreters:
-                if word.find(i) > -1:
-                    return False
-            return True
-
-        if cline and cline[0].startswith("/"):
-            cline[0] =  os.path.basename(cline[0])
-        out = ":".join(filter(None,filter(not_interpreter, cline)))
-        try:
-            out = out.split()[0].strip(":")[:20]
-        except IndexError:
-            out = os.path.basename(_cmdline[0])
-
-        return out
-
-    def _get_attr(self, attr:str) -> int:
-        """
-            Returns summary for the attribute attr
-        """
-        filtered = filter(lambda x: x != None and getattr(x, attr) != None, self.proclist)
-        return sum([getattr(p, attr) for p in  filtered])
+        return name_from_cmdline(tuple(proc._cmdline))
 
     def get_n_ctx_switches_vol(self) -> int:
         """
             Returns sum of voluntary context switches for all processes
             in the current bundle
         """
-        return self._get_attr("ctx_vol")
-
+        return self.ctx_vol
 
     def get_n_ctx_switches_invol(self) -> int:
         """
             Returns sum of involuntary context switches for all processes
             in the current bundle
         """
-        return self._get_attr("ctx_invol")
-
+        return self.ctx_invol
 
     def get_memory_info_rss(self) -> int:
         """
             Returns sum of resident memory sizes for all processes
             in the current bundle
         """
-        return self._get_attr("rss")
-
+        return self.rss
 
     def get_memory_info_vms(self) -> int:
         """
             Returns sum of virtual memory sizes for all processes
             in the current bundle
         """
-        return self._get_attr("vms")
-
+        return self.vms
 
     def get_cpu_percent(self) -> float:
         """
             Returns sum of consumed CPU percent for all processes
             in the current bundle
         """
-        return self._get_attr("pcpu")
+        return self.pcpu
+
+class OtherBundle:
+    """
+        Synthetic bundle holding summary stats of the bundles left out
+        of the top list, so host totals stay accurate
+    """
+    def __init__(self, bundles, name=OTHER_NAME):
+        self.bundle_name = name
+        self.bundles = bundles
+        self.ctx_vol = sum(b.ctx_vol for b in bundles)
+        self.ctx_invol = sum(b.ctx_invol for b in bundles)
+        self.vms = sum(b.vms for b in bundles)
+        self.rss = sum(b.rss for b in bundles)
+        self.pcpu = sum((b.pcpu for b in bundles), 0.0)
+        self.nprocs = sum(b.nprocs for b in bundles)
+        self.rss_max = max((b.rss_max for b in bundles), default=0)
+        self.pcpu_max = max((b.pcpu_max for b in bundles), default=0.0)
 
 
 '''
@@ -2,57 +2,51 @@
 
 import psutil
 import logging
-import os
+import sys
+from zaggregator.procscan import PsutilScanner
 
 class ProcessMirror:
     """
-        Class provides cachable and transparent copy of psutil.Process
-        with some fields overwritten to avoid direct calling of
-        psutil.Process methods, as they are inconsistent for dead processes
+        Class provides cachable copy of psutil.Process state collected
+        in one sampling cycle, to avoid direct calling of psutil.Process
+        methods, as they are inconsistent for dead processes. Mirror keeps
+        no reference to psutil.Process, related processes are looked up
+        in the proctable's snapshot
 
     """
-    def __init__(self, proc: psutil.Process, proctable):
+    __slots__ = ("pid", "rss", "vms", "ctx_vol", "ctx_invol", "pcpu",
+            "_pt", "_pgid", "_start", "_parent", "_name", "_cmdline")
+
+    def __init__(self, proc, proctable):
         """
-            Class constructor
+            Class constructor, proc could be either psutil.Process or
+            ProcRecord collected by one of the zaggregator.procscan scanners
         """
 
-        _dead = False
-        self._children = list()
-        self._parent = 0
-        parent = None
+        record = PsutilScanner.record(proc) if isinstance(proc, psutil.Process) else proc
 
-        self._proc, self._pt = proc, proctable
-        try:
-            self._pgid = os.getpgid(proc.pid)
-        except Exception as e:
-            self._pgid = 0
-            _dead = True
-
-        if not _dead:
-            parent = proc.parent()
-
-        if parent:
-            self._parent = parent.pid
-
-        if not _dead:
-            self._children = [ p.pid for p in proc.children() ]
-
-        with proc.oneshot():
-            if proc.is_running():
-                self.rss = proc.memory_info().rss
-                self.vms = proc.memory_info().vms
-                self.ctx_vol = proc.num_ctx_switches().voluntary
-                self.ctx_invol = proc.num_ctx_switches().involuntary
-                self._cmdline = proc.cmdline()
-                self.pcpu = None
-                #self.pcpu += proc.cpu_percent(interval=DEFAULT_INTERVAL)
-            else:
-                self.rss = 0
-                self.vms = 0
-                self.ctx_vol = 0
-                self.ctx_invol = 0
-                self.cmdline = [ ]
-                self.pcpu = 0.0
+        self._pt = proctable
+        self.pid = record.pid
+        self._pgid = record.pgid
+        self._start = record.start
+        self._parent = record.ppid
+        self._name = sys.intern(record.name)
+        self._cmdline = record.cmdline
+        self.rss = record.rss
+        self.vms = record.vms
+        self.ctx_vol = record.ctx_vol
+        self.ctx_invol = record.ctx_invol
+        self.pcpu = None
+
+    def refresh(self, record):
+        """
+            Update cheap counters from a newer ProcRecord of the same process
+        """
+        self._parent = record.ppid
+        self.rss = record.rss
+        self.vms = record.vms
+        self.ctx_vol = record.ctx_vol
+        self.ctx_invol = record.ctx_invol
 
     def __str__(self):
         return "<{} name={} pid={} _pgid={} alive={} >\n".format(self.__class__.__name__,
@@ -62,31 +56,46 @@ class ProcessMirror:
     def __repr__(self):
         return self.__str__()
 
-    def __getattribute__(self, name: str):
+    @property
+    def alive(self) -> bool:
+        """
+            Checks if the process still exists in the system
+        """
+        return psutil.pid_exists(self.pid)
+
+    def pidm(self, pid: int):
+        """
+            Returns ProcessMirror of the process with pid from the same
+            proctable or False if there is no such process
+        """
+        try:
+            return self._pt.mirrors[pid]
+        except (AttributeError, KeyError):
+            return False
+
+    def parent(self):
+        return self.pidm(self._parent)
+
+    def children(self) -> list:
+        """
+            Answered from the proctable's snapshot ppid index
+        """
+        if not self._pt:
+            return []
+        return [ self.pidm(p) for p in self._pt.children_pids(self.pid) ]
+
+    def cmdline(self) -> [str]:
+        return self._cmdline
+
+    def name(self) -> str:
+        return self._name
+
+    def cwd(self) -> str:
         """
-            Masquerade psutil.Process's fields and methods
+            Current working directory isn't sampled, so it is the only
+            value read from the live process
         """
-        if name.startswith("_"):
-            return object.__getattribute__(self, name)
-        elif name == "alive":
-            return self._proc.is_running()
-        elif name == "pidm":
-            def __wrapper(x):
-                try:
-                    return self._pt.mirrors[x]
-                except KeyError:
-                    return False
-            return __wrapper
-        elif name == "parent":
-            return lambda: self.pidm(self._parent)
-        elif name == "children":
-            return lambda: [ self.pidm(p) for p in self._children ]
-        elif name == "cmdline":
-            return lambda: self._cmdline
-        elif hasattr(self._proc, name):
-            return getattr(self._proc, name)
-        else:
-            return object.__getattribute__(self, name)
+        return psutil.Process(self.pid).cwd()
 
     def set_pcpu(self, value):
         """
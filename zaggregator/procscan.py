@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+import psutil
+import os
+import sys
+import time
+from collections import namedtuple
+
+PROCFS = "/proc"
+
+ProcRecord = namedtuple("ProcRecord", (
+    "pid", "ppid", "pgid", "name", "cmdline",
+    "rss", "vms", "ctx_vol", "ctx_invol",
+    "start", "cpu_time",
+    ))
+ProcRecord.__doc__ = """
+    Flat snapshot of a single process, filled by one of the scanners.
+    `start' is process start time in seconds since boot, `cpu_time' is
+    cumulative user+system time in seconds
+    """
+
+class LinuxScanner:
+    """
+        Collects process table by reading /proc/<pid>/{stat,status,cmdline}
+        directly, once per pid
+    """
+    def __init__(self, procfs=PROCFS):
+        self.procfs = procfs
+        self._pagesize = os.sysconf("SC_PAGE_SIZE")
+        self._clk_tck = os.sysconf("SC_CLK_TCK")
+
+    def scan(self, known=None) -> [ProcRecord]:
+        """
+            Returns list of ProcRecords for all processes in the system,
+            see LinuxScanner.read() for `known'
+        """
+        records = []
+        for entry in os.listdir(self.procfs):
+            if not entry.isdigit():
+                continue
+            record = self.read(int(entry), known)
+            if record:
+                records.append(record)
+        return records
+
+    def read(self, pid: int, known=None) -> ProcRecord:
+        """
+            Returns ProcRecord for the process with pid or None if process
+            has gone while reading. `known' maps (pid, start) to the process
+            name seen before: cmdline of such processes isn't read again
+            and returned as None unless the process has exec'd
+        """
+        base = "{}/{}/".format(self.procfs, pid)
+        try:
+            with open(base + "stat", "rb") as fd:
+                stat = fd.read()
+            with open(base + "status", "rb") as fd:
+                status = fd.read()
+        except OSError:
+            return None
+
+        # process name is enclosed in parentheses and can contain
+        # both spaces and parentheses itself
+        rpar = stat.rfind(b")")
+        name = os.fsdecode(stat[stat.find(b"(") + 1:rpar])
+        fields = stat[rpar + 2:].split()
+        start = int(fields[19]) / self._clk_tck
+
+        seen = known.get((pid, start)) if known else None
+        if seen is not None and seen.startswith(name):
+            name, cmdline = seen, None
+        else:
+            try:
+                with open(base + "cmdline", "rb") as fd:
+                    cmdline = parse_cmdline(os.fsdecode(fd.read()))
+            except OSError:
+                return None
+            name = extend_name(name, cmdline)
+
+        ctx_vol = ctx_invol = 0
+        for line in status.splitlines():
+            if line.startswith(b"voluntary_ctxt_switches:"):
+                ctx_vol = int(line.split()[1])
+            elif line.startswith(b"nonvoluntary_ctxt_switches:"):
+                ctx_invol = int(line.split()[1])
+
+        return ProcRecord(
+                pid=pid,
+                ppid=int(fields[1]),
+                pgid=int(fields[2]),
+                name=name,
+                cmdline=cmdline,
+                rss=int(fields[21]) * self._pagesize,
+                vms=int(fields[20]),
+                ctx_vol=ctx_vol,
+                ctx_invol=ctx_invol,
+                start=start,
+                cpu_time=(int(fields[11]) + int(fields[12])) / self._clk_tck,
+                )
+
+    def uptime(self) -> float:
+        """
+            Returns seconds since boot
+        """
+        with open(self.procfs + "/uptime", "rb") as fd:
+            return float(fd.read().split()[0])
+
+    def cpu_total(self) -> float:
+        """
+            Returns total CPU time of the host in seconds divided by number
+            of CPUs, i.e. elapsed time as seen by a single CPU
+        """
+        total, ncpus = 0, 0
+        with open(self.procfs + "/stat", "rb") as fd:
+            for line in fd:
+                if not line.startswith(b"cpu"):
+                    break
+                if line.startswith(b"cpu "):
+                    # guest time is already accounted in user time
+                    total = sum(map(int, line.split()[1:9]))
+                else:
+                    ncpus += 1
+        return total / self._clk_tck / max(ncpus, 1)
+
+
+class PsutilScanner:
+    """
+        Collects process table with psutil, used on platforms without
+        Linux-like procfs
+    """
+    def scan(self, known=None) -> [ProcRecord]:
+        """
+            Returns list of ProcRecords for all processes in the system,
+            see LinuxScanner.read() for `known'
+        """
+        records = []
+        for proc in psutil.process_iter():
+            try:
+                records.append(PsutilScanner.record(proc, known))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        return records
+
+    @staticmethod
+    def record(proc: psutil.Process, known=None) -> ProcRecord:
+        """
+            Returns ProcRecord for psutil.Process, processes died before
+            sampling get zeroed counters
+        """
+        ppid, name = 0, ""
+        try:
+            pgid = os.getpgid(proc.pid)
+            with proc.oneshot():
+                ppid, name = proc.ppid(), proc.name()
+                memory, ctx = proc.memory_info(), proc.num_ctx_switches()
+                times = proc.cpu_times()
+                start = proc.create_time() - psutil.boot_time()
+                seen = known.get((proc.pid, start)) if known else None
+                return ProcRecord(
+                        pid=proc.pid,
+                        ppid=ppid,
+                        pgid=pgid,
+                        name=name,
+                        cmdline=None if seen == name else proc.cmdline(),
+                        rss=memory.rss,
+                        vms=memory.vms,
+                        ctx_vol=ctx.voluntary,
+                        ctx_invol=ctx.involuntary,
+                        start=start,
+                        cpu_time=times.user + times.system,
+                        )
+        except psutil.ZombieProcess:
+            return ProcRecord(proc.pid, ppid, pgid, name, [], 0, 0, 0, 0, 0.0, 0.0)
+        except (OSError, psutil.NoSuchProcess, psutil.AccessDenied):
+            return ProcRecord(proc.pid, ppid, 0, name, [], 0, 0, 0, 0, 0.0, 0.0)
+
+    def uptime(self) -> float:
+        """
+            Returns seconds since boot
+        """
+        return time.time() - psutil.boot_time()
+
+    def cpu_total(self) -> float:
+        """
+            Returns total CPU time of the host in seconds divided by number
+            of CPUs, i.e. elapsed time as seen by a single CPU
+        """
+        return sum(psutil.cpu_times()) / (psutil.cpu_count() or 1)
+
+
+def parse_cmdline(data: str) -> [str]:
+    """
+        Split raw /proc/<pid>/cmdline the same way psutil does, including
+        processes which have changed their titles with setproctitle()
+    """
+    if not data:
+        return []
+    sep = "\x00" if data.endswith("\x00") else " "
+    if data.endswith(sep):
+        data = data[:-1]
+    cmdline = data.split(sep)
+    if sep == "\x00" and len(cmdline) == 1 and " " in data:
+        cmdline = data.split(" ")
+    return cmdline
+
+def extend_name(name: str, cmdline: [str]) -> str:
+    """
+        Kernel truncates process names to 15 characters, recover the full
+        name from cmdline the same way psutil does
+    """
+    if len(name) >= 15 and cmdline:
+        extended = os.path.basename(cmdline[0])
+        if extended.startswith(name):
+            return extended
+    return name
+
+def get_scanner():
+    """
+        Returns the fastest scanner available on current platform
+    """
+    if sys.platform.startswith("linux") and os.path.isdir(PROCFS):
+        return LinuxScanner()
+    return PsutilScanner()
@@ -2,64 +2,197 @@
 
 import psutil
 import logging
-import time
+import heapq
+from zaggregator import procscan
 from zaggregator.procmirror import ProcessMirror
-from zaggregator.procbundle import ProcBundle
-from zaggregator.config import DEFAULT_INTERVAL, metrics
+from zaggregator.procbundle import ProcBundle, OtherBundle
+from zaggregator.pcpu import CpuSampler
+from zaggregator.columns import ProcColumns
+from zaggregator.config import DEFAULT_INTERVAL, metrics, top_k, top_other
 
 class ProcTable:
     """
         Class represents cached process table for the sampling period
     """
-    def __init__(self):
+    def __init__(self, scanner=None, cpu_sampler=None):
+        self._scanner = scanner or procscan.get_scanner()
+        # long-living sampler keeps CPU times from the previous cycle
+        self._cpu_sampler = cpu_sampler or CpuSampler()
+        # ProcessMirrors by (pid, start time), kept between cycles
+        self._entries = {}
         self._procs = []
-        # fill the self._procs with ProcessMirrors of psutil processes
-        _pcs = list(psutil.process_iter())
-        list(map(self._procs.append, map(ProcessMirror, _pcs, len(_pcs)*[self] )))
-        # set cpu_percent sampler
-        [ process_call_guard(p.cpu_percent) for p in self._procs ]
-        # wait for samples to collect
-        time.sleep(DEFAULT_INTERVAL)
-        # collect the samples
-        pcpu = [ process_call_guard(p.cpu_percent) for p in self._procs ]
-        # and map them to the corresponding ProcessMirror object
-        list(map(lambda a,b: a.set_pcpu(b), self._procs, pcpu))
+        self.mirrors = {}
+        # registered ProcBundles in registration order, dict is used as
+        # ordered set, and the same bundles indexed by name
+        self._registry = {}
+        self._by_name = {}
+        # pid -> registered ProcBundle the process belongs to
+        self._bundle_of = {}
+        self._expendable = {}
+        # columnar copy of the snapshot, rebuilt each cycle
+        self.columns = None
+        self.update()
+
+    def update(self):
+        """
+            Refresh the table for a new sampling cycle: drop exited processes,
+            add new ones and refresh only the counters of survivors. Cached
+            cmdline, pgid and bundle assignment are reused unless the process
+            has exec'd or changed its process group.
+        """
+        known = { key: m._name for key, m in self._entries.items() }
+        records = self._scanner.scan(known=known)
+        new, gone = self._mirror(records)
+        # CPU percent since the previous cycle, or since process start
+        pcpu = self._cpu_sampler.sample(records, self._scanner.cpu_total(),
+                self._scanner.uptime())
+        for p in self._procs: p.set_pcpu(pcpu[p.pid])
         # fill mirrors dict for faster mirror searching
         self.mirrors = {}
         for p in self._procs: self.mirrors.setdefault(p.pid, p)
 
-        self.bundles = []
+        # forget exited processes, bundles left without processes are gone
+        if gone:
+            for m in gone: self._bundle_of.pop(m.pid, None)
+            gone = set(map(id, gone))
+            for b in self.bundles:
+                b.discard(gone)
+                if not b.proclist: self._unregister(b)
+
+        self._bundle(self._adopt(new))
+        self._merge_duplicates()
+        self._aggregate()
+
+    def _mirror(self, records) -> ([ProcessMirror], [ProcessMirror]):
+        """
+            Update ProcessMirrors from the snapshot records, returns new
+            mirrors and mirrors of exited processes
+        """
+        # index children by parent pid once for the whole snapshot, so
+        # children(), parent() and subtree walks never go back to psutil
+        self._children = {}
+        for r in records: self._children.setdefault(r.ppid, []).append(r.pid)
+
+        entries, new = {}, []
+        for r in records:
+            key = (r.pid, r.start)
+            mirror = self._entries.get(key)
+            if mirror and r.cmdline is None and r.pgid == mirror._pgid:
+                mirror.refresh(r)
+            else:
+                if r.cmdline is None:
+                    # process group changed, but the process hasn't exec'd
+                    r = r._replace(cmdline=mirror._cmdline if mirror else [])
+                mirror = ProcessMirror(r, self)
+                new.append(mirror)
+            entries[key] = mirror
+
+        alive = set(map(id, entries.values()))
+        gone = [ m for m in self._entries.values() if id(m) not in alive ]
+        self._entries = entries
+        self._procs = list(entries.values())
+        return new, gone
 
-        # create expendable copy of the process list)
-        self._expendable = list(self._procs)
+    def _adopt(self, procs: [ProcessMirror]) -> [ProcessMirror]:
+        """
+            Append new processes to the bundle of their parent when both are
+            in the same process group, as full bundling would do. Returns
+            processes which still need bundling.
+        """
+        if not self._bundle_of:
+            return procs
+
+        rest = []
+        # parents are started before their children
+        for p in sorted(procs, key=lambda x: x._start):
+            parent = p.parent()
+            bundle = self._bundle_of.get(parent.pid) if parent else None
+            if bundle and parent._pgid == p._pgid:
+                bundle.append(p)
+            else:
+                rest.append(p)
+        return rest
+
+    def _bundle(self, procs: [ProcessMirror]):
+        """
+            Group not yet bundled processes into ProcBundles
+        """
+        # processes not bundled yet, registered bundles remove their
+        # processes from here as they go
+        self._expendable = { p.pid: p for p in procs }
 
         # collect the group id's of process groups
-        pgids = list(set([p._pgid for p in self._procs]))
+        groups = {}
+        for p in procs: groups.setdefault(p._pgid, []).append(p)
+        pgids = list(set(groups))
 
         #kernelProcs = list(filter(lambda x: utils.is_kernel_thread(x), self._expendable))
         #list(map(self._expendable.remove, kernelProcs))
 
-        mirrors_by_pgid = list(map(self.mirrors_by_pgid, pgids))
+        mirrors_by_pgid = [ groups[pgid] for pgid in pgids ]
         mirrors_by_pgid.sort(key=lambda x: len(x), reverse=True)
         while len(self._expendable) > 0:
             for ms in mirrors_by_pgid:
-                    self.bundles.append(ProcBundle(ms, pt=self))
-                    self._clear_expendable()
+                    self.register(ProcBundle(ms, pt=self))
 
-        uniq_names = list(set(self.get_bundle_names()))
-        for name in uniq_names:
-            n = self._get_bundles_by_name(name)
+    def _merge_duplicates(self):
+        """ Merge registered bundles of the same name into the first one """
+        for n in [ list(n) for n in self._by_name.values() if len(n) > 1 ]:
             for b in n[1:]:
                 n[0].merge(b)
 
-        #    self.get_bundle_names()
+    def _aggregate(self):
+        """
+            Calculate summary stats of all registered bundles at once over
+            the columnar snapshot of the table
+        """
+        bundles = self.bundles
+        self.columns = ProcColumns.from_groups([ b.proclist for b in bundles ])
+        stats = self.columns.aggregate(len(bundles))
+        for i, b in enumerate(bundles): b.set_stats(stats, i)
 
+    def register(self, bundle: ProcBundle):
+        """
+            Register ProcBundle in the table and mark its processes as bundled
+        """
+        bundle.registered = True
+        self._registry[bundle] = None
+        self._by_name.setdefault(bundle.bundle_name, {})[bundle] = None
+        for p in bundle.proclist: self._mark_bundled(p, bundle)
 
+    def _mark_bundled(self, proc: ProcessMirror, bundle: ProcBundle):
+        """ Record that process belongs to the registered bundle """
+        self._bundle_of.setdefault(proc.pid, bundle)
+        self._expendable.pop(proc.pid, None)
 
-    def _clear_expendable(self):
-        """ Clean up expendable processes list from bundled processes """
-        list(map(lambda p: self._expendable.remove(p) if p in self.bundled() and p in
-            self._expendable else None, self._expendable))
+    def _merged(self, bundle: ProcBundle, into: ProcBundle):
+        """ Move processes of merged bundle to the bundle it was merged into """
+        for p in bundle.proclist:
+            if self._bundle_of.get(p.pid) is bundle:
+                self._bundle_of[p.pid] = into
+        self._unregister(bundle)
+
+    def _unregister(self, bundle: ProcBundle):
+        """ Remove ProcBundle from the registry """
+        bundle.registered = False
+        del self._registry[bundle]
+        named = self._by_name[bundle.bundle_name]
+        del named[bundle]
+        if not named:
+            del self._by_name[bundle.bundle_name]
+
+    @property
+    def bundles(self) -> [ProcBundle]:
+        """ List of registered ProcBundles """
+        return list(self._registry)
+
+    def is_bundled(self, proc: ProcessMirror) -> bool:
+        """ Checks if process belongs to any of registered ProcBundles """
+        return proc.pid in self._bundle_of
+
+    def bundle_of(self, pid: int) -> ProcBundle:
+        """ Returns registered ProcBundle of the process or None """
+        return self._bundle_of.get(pid)
 
 
     def mirrors_by_pgid(self, pgid: int) -> [ProcessMirror]:
@@ -73,6 +206,26 @@ class ProcTable:
         else:
             return None
 
+    def children_pids(self, pid: int) -> [int]:
+        """ Returns pids of direct children of the process from the snapshot """
+        return self._children.get(pid, [])
+
+    def descendants(self, pid: int) -> [int]:
+        """
+            Returns pids of all descendants of the process from the snapshot,
+            same as psutil.Process.children(recursive=True)
+        """
+        ret, seen = [], {pid}
+        stack = list(reversed(self.children_pids(pid)))
+        while stack:
+            child = stack.pop()
+            if child in seen:
+                continue
+            seen.add(child)
+            ret.append(child)
+            stack.extend(reversed(self.children_pids(child)))
+        return ret
+
     def bundled(self) -> list:
         """
             Returns list of all ProcessMirrors in all registered ProcBundles
@@ -86,7 +239,7 @@ class ProcTable:
         """
             Returns list of names of registered ProcBundles
         """
-        return [ b.bundle_name for b in self.bundles ]
+        return list(self._by_name)
 
     def _get_bundles_by_name(self, name: str):
         """
@@ -96,16 +249,16 @@ class ProcTable:
             with similar names. Should't be called outside of ProcTable internal
             context.
         """
-        if name in self.get_bundle_names():
-            return list(filter(lambda x: x.bundle_name == name, self.bundles))
+        if name in self._by_name:
+            return list(self._by_name[name])
         return None
 
     def get_bundle_by_name(self, name: str):
         """
             Returns ProcBundle with desired name or None for non-existing bundles
         """
-        if name in self.get_bundle_names():
-            return list(filter(lambda x: x.bundle_name == name, self.bundles))[0]
+        if name in self._by_name:
+            return next(iter(self._by_name[name]))
         return None
 
     def get_idle(self, interval=DEFAULT_INTERVAL):
@@ -114,16 +267,51 @@ class ProcTable:
         """
         return psutil.cpu_times_percent(interval=interval).idle
 
-    def get_top_5s(self) -> [ProcBundle]:
+    def get_top(self, k: int = top_k, metrics: tuple = metrics,
+            other: bool = False) -> [ProcBundle]:
         """
-            Get top10 bundles by each of the metrics and return list of bundles
+            Get top `k' bundles by each of the metrics in one pass over the
+            bundles. Returns bundles in order of metrics and rank, each bundle
+            once. With `other' set, the list ends with OtherBundle summing up
+            everything not selected.
         """
-        tops = []
+        heaps = { m: [] for m in metrics }
+        bundles = self.bundles
+        for i, b in enumerate(bundles):
+            for m in metrics:
+                # earlier bundles win ties, as with stable sorting
+                item = (getattr(b, m) or 0, -i)
+                heap = heaps[m]
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+        tops = {}
         for m in metrics:
-            func = lambda b: b.__getattribute__(m)
-            tops.extend(sorted(self.bundles, key=func, reverse=True)[:5])
+            for value, i in sorted(heaps[m], reverse=True):
+                tops.setdefault(-i, bundles[-i])
+        tops = list(tops.values())
+
+        if other:
+            selected = set(map(id, tops))
+            tops.append(OtherBundle([ b for b in bundles if id(b) not in selected ]))
+        return tops
 
-        return list(set(tops))
+    def get_top_5s(self) -> [ProcBundle]:
+        """
+            Get top5 bundles by each of the metrics and return list of bundles
+        """
+        return self.get_top(5)
+
+
+def top_rows(proctable: ProcTable) -> list:
+    """
+        Rows (name, rss, vms, ctxvol, ctxinvol, pcpu) of top bundles of
+        the process table, as stored by the daemon each cycle
+    """
+    return [ (b.bundle_name, b.rss, b.vms, b.ctx_vol, b.ctx_invol, b.pcpu)
+            for b in proctable.get_top(top_k, metrics, top_other) ]
 
 
 def process_call_guard(func, *args, **kwargs):
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+import argparse
+import cProfile
+import gzip
+import json
+import platform
+import pstats
+import sys
+import time
+from zaggregator import procscan, sqlite
+from zaggregator.procscan import ProcRecord
+from zaggregator.proctable import ProcTable, top_rows
+
+# Recorded process tables of a host for offline runs of ProcTable. The
+# file is gzipped JSON lines: header (magic, version, ProcRecord fields,
+# host name) and one line per cycle with unix time of the cycle, uptime,
+# total CPU time and ProcRecords as lists. Command line of a process
+# recorded in the previous cycle with the same pid and start time is
+# null unless the process has exec'd, as scanners return it.
+MAGIC = "zaggregator-replay"
+VERSION = 1
+
+class BadReplay(Exception): pass
+
+def emulate_known(records, known) -> [ProcRecord]:
+    """
+        Returns records with cmdline of processes named as in `known' set
+        to None, as scanners skip reading it, see LinuxScanner.read()
+    """
+    if not known:
+        return records
+    return [ r._replace(cmdline=None) if known.get((r.pid, r.start)) == r.name else r
+            for r in records ]
+
+class Recorder:
+    """
+        Scanner writing each cycle of the underlying scanner into the
+        replay file at `path', can be passed to ProcTable in place of the
+        scanner. Returns the same records as the scanner would.
+    """
+    def __init__(self, path: str, scanner=None):
+        self._scanner = scanner or procscan.get_scanner()
+        self._fd = gzip.open(path, "wt", encoding="utf-8")
+        self._fd.write(json.dumps({ "magic": MAGIC, "version": VERSION,
+            "fields": ProcRecord._fields, "host": platform.node() }) + "\n")
+        # command lines by (pid, start) of the previous cycle
+        self._cmdlines = {}
+        self._uptime = self._cpu_total = None
+        self.cycles = 0
+
+    def scan(self, known=None) -> [ProcRecord]:
+        # own names, so the file depends on the recorded cycles only
+        names = { key: name for key, (name, cmdline) in self._cmdlines.items() }
+        records = self._scanner.scan(known=names)
+        self._cpu_total = self._scanner.cpu_total()
+        self._uptime = self._scanner.uptime()
+        self._fd.write(json.dumps({ "ts": time.time(), "uptime": self._uptime,
+            "cpu_total": self._cpu_total, "records": records }) + "\n")
+        self._fd.flush()
+        self.cycles += 1
+
+        cmdlines, full = {}, []
+        for r in records:
+            key = (r.pid, r.start)
+            if r.cmdline is None:
+                r = r._replace(cmdline=self._cmdlines[key][1])
+            cmdlines[key] = (r.name, r.cmdline)
+            full.append(r)
+        self._cmdlines = cmdlines
+        return emulate_known(full, known)
+
+    def uptime(self) -> float:
+        return self._uptime
+
+    def cpu_total(self) -> float:
+        return self._cpu_total
+
+    def close(self) -> None:
+        self._fd.close()
+
+class Cycle:
+    """ Recorded cycle, records have all the command lines filled """
+    def __init__(self, ts: float, uptime: float, cpu_total: float, records: list):
+        self.ts = ts
+        self.uptime = uptime
+        self.cpu_total = cpu_total
+        self.records = records
+
+def load(path: str) -> (dict, [Cycle]):
+    """
+        Read replay file, returns its header and cycles
+    """
+    cycles, cmdlines = [], {}
+    with gzip.open(path, "rt", encoding="utf-8") as fd:
+        try:
+            header = json.loads(fd.readline())
+        except ValueError:
+            raise BadReplay("not a replay file")
+        if header.get("magic") != MAGIC or header.get("version") != VERSION:
+            raise BadReplay("unsupported format {!r} {!r}".format(
+                header.get("magic"), header.get("version")))
+        if tuple(header["fields"]) != ProcRecord._fields:
+            raise BadReplay("unsupported fields {}".format(header["fields"]))
+        for line in fd:
+            cycle = json.loads(line)
+            records, current = [], {}
+            for fields in cycle["records"]:
+                r = ProcRecord(*fields)
+                key = (r.pid, r.start)
+                if r.cmdline is None:
+                    if key not in cmdlines:
+                        raise BadReplay("no command line of pid {} in cycle {}".format(
+                            r.pid, len(cycles)))
+                    r = r._replace(cmdline=cmdlines[key])
+                current[key] = r.cmdline
+                records.append(r)
+            cmdlines = current
+            cycles.append(Cycle(cycle["ts"], cycle["uptime"], cycle["cpu_total"], records))
+    return header, cycles
+
+class ReplayScanner:
+    """
+        Scanner replaying recorded cycles one per scan() call, raises
+        EOFError after the last one
+    """
+    def __init__(self, path: str):
+        self.header, self.cycles = load(path)
+        self.ncycle = -1
+
+    def __len__(self) -> int:
+        return len(self.cycles)
+
+    @property
+    def cycle(self) -> Cycle:
+        return self.cycles[self.ncycle]
+
+    def scan(self, known=None) -> [ProcRecord]:
+        if self.ncycle + 1 >= len(self.cycles):
+            raise EOFError("no more recorded cycles")
+        self.ncycle += 1
+        return emulate_known(self.cycle.records, known)
+
+    def uptime(self) -> float:
+        return self.cycle.uptime
+
+    def cpu_total(self) -> float:
+        return self.cycle.cpu_total
+
+def record(path: str, ncycles: int, interval: float, scanner=None) -> int:
+    """
+        Record `ncycles' cycles of the process table `interval' seconds
+        apart, returns number of processes in the last one
+    """
+    recorder, records = Recorder(path, scanner), []
+    try:
+        for n in range(ncycles):
+            if n:
+                time.sleep(interval)
+            records = recorder.scan()
+    finally:
+        recorder.close()
+    return len(records)
+
+def summary(proctable: ProcTable) -> dict:
+    """
+        Number of processes and summary stats of all bundles by name
+    """
+    return { b.bundle_name: [ b.nprocs, b.rss, b.vms, b.ctx_vol, b.ctx_invol, b.pcpu ]
+            for b in proctable.bundles }
+
+def replay(path: str, dbpath: str = None, profile: cProfile.Profile = None) -> ([dict], [float]):
+    """
+        Run recorded cycles through ProcTable and store top bundles into
+        sqlite database at `dbpath' as the daemon does, returns summary
+        and seconds spent in ProcTable of each cycle. `profile' is enabled
+        for ProcTable only.
+    """
+    if dbpath:
+        sqlite.__init__(dbpath)
+    scanner = ReplayScanner(path)
+    summaries, elapsed, pt = [], [], None
+    for n in range(len(scanner)):
+        if profile:
+            profile.enable()
+        start = time.perf_counter()
+        if pt is None:
+            pt = ProcTable(scanner=scanner)
+        else:
+            pt.update()
+        rows = top_rows(pt)
+        elapsed.append(time.perf_counter() - start)
+        if profile:
+            profile.disable()
+        if dbpath:
+            sqlite.add_records(scanner.cycle.ts, rows)
+        summaries.append(summary(pt))
+    return summaries, elapsed
+
+def compare(summaries: [dict], baseline: [dict], rel: float = 1e-9) -> [str]:
+    """
+        Differences of bundle names and sums between replays of the same
+        file, pcpu is compared with `rel' tolerance
+    """
+    diffs = []
+    if len(summaries) != len(baseline):
+        diffs.append("{} cycles, {} in baseline".format(len(summaries), len(baseline)))
+    for n, (bundles, base) in enumerate(zip(summaries, baseline)):
+        for name in sorted(set(bundles) ^ set(base)):
+            diffs.append("cycle {}: bundle {!r} only in {}".format(n, name,
+                "replay" if name in bundles else "baseline"))
+        for name in sorted(set(bundles) & set(base)):
+            values, old = bundles[name], base[name]
+            pcpu, opcpu = values[-1], old[-1]
+            if values[:-1] != old[:-1] or abs(pcpu - opcpu) > rel * max(abs(pcpu), abs(opcpu)):
+                diffs.append("cycle {}: bundle {!r} {} != {}".format(n, name, values, old))
+    return diffs
+
+def main():
+    """ Record process table of this host or replay a recorded one """
+    parser = argparse.ArgumentParser(description='Zabbix aggregator process table recorder.')
+    commands = parser.add_subparsers(dest="command")
+    rec = commands.add_parser("record", help="record process table of this host")
+    rec.add_argument("path")
+    rec.add_argument("-n", "--cycles", type=int, default=10)
+    rec.add_argument("-i", "--interval", type=float, default=30.0,
+            help="seconds between cycles")
+    rep = commands.add_parser("replay", help="run recorded cycles through ProcTable")
+    rep.add_argument("path")
+    rep.add_argument("--db", help="store top bundles into this sqlite database")
+    rep.add_argument("-o", "--output", help="store bundle names and sums as JSON")
+    rep.add_argument("-c", "--compare", help="JSON bundle names and sums of a previous replay")
+    rep.add_argument("--profile", action="store_true", help="print cProfile stats")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        nprocs = record(args.path, args.cycles, args.interval)
+        print("{} cycles recorded, {} processes in the last one".format(args.cycles, nprocs))
+    elif args.command == "replay":
+        profile = cProfile.Profile() if args.profile else None
+        summaries, elapsed = replay(args.path, args.db, profile)
+        for n, (bundles, seconds) in enumerate(zip(summaries, elapsed)):
+            print("cycle {}: {} bundles, {:.2f} ms".format(n, len(bundles), seconds * 1000))
+        if profile:
+            pstats.Stats(profile).sort_stats("cumulative").print_stats(30)
+        if args.output:
+            with open(args.output, "w") as fd:
+                json.dump(summaries, fd)
+        if args.compare:
+            with open(args.compare) as fd:
+                diffs = compare(summaries, json.load(fd))
+            for d in diffs:
+                print(d)
+            if diffs:
+                sys.exit(1)
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
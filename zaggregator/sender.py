@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+import asyncio
+import collections
+import json
+import logging
+import socket
+import struct
+from zaggregator.output import discovery_json
+from zaggregator.config import ZABBIX_PORT, ZABBIX_HOST, SENDER_TIMEOUT
+from zaggregator.config import sender_queue_max, sender_retry_min, sender_retry_max
+
+# protocol signature and version, followed by little-endian data length
+HEADER = b"ZBXD\x01"
+HEADER_LEN = len(HEADER) + 8
+# trapper keys, same as UserParameters in misc/zaggregator.conf, Zabbix
+# matches them literally against the keys of misc/zbx_export_templates*.xml
+DISCOVERY_KEY = "ps.discovery"
+ITEM_KEY = "ps.procstat"
+
+class ProtocolError(Exception): pass
+
+def encode(request: dict) -> bytes:
+    """ Returns Zabbix protocol packet with JSON encoded `request' """
+    payload = json.dumps(request).encode()
+    return HEADER + struct.pack("<Q", len(payload)) + payload
+
+def decode_header(header: bytes) -> int:
+    """ Returns data length from Zabbix protocol header """
+    if len(header) != HEADER_LEN or not header.startswith(HEADER):
+        raise ProtocolError("bad header: {!r}".format(header))
+    return struct.unpack("<Q", header[len(HEADER):])[0]
+
+def quote_param(param: str) -> str:
+    """ Quote item key parameter if Zabbix key syntax requires it """
+    if param and not any(c in param for c in ',]"') and not param.startswith(" "):
+        return param
+    return '"{}"'.format(param.replace('"', '\\"'))
+
+def item_key(bname: str, check: str) -> str:
+    """
+        Returns trapper item key of `check' of bundle `bname', e.g.
+        ps.procstat[nginx, rss], spelled as the template item prototypes
+    """
+    return "{}[{}, {}]".format(ITEM_KEY, quote_param(bname), check)
+
+def sender_data(host: str, names, ts: int, bundles: dict) -> dict:
+    """
+        Returns "sender data" request with autodiscovery data for `names'
+        and {metric: value} of each of `bundles' collected at unix time `ts'
+    """
+    data = [{ "host": host, "key": DISCOVERY_KEY,
+        "value": discovery_json(names), "clock": ts }]
+    for bname, values in bundles.items():
+        for check, value in values.items():
+            data.append({ "host": host, "key": item_key(bname, check),
+                "value": str(value), "clock": ts })
+    return { "request": "sender data", "data": data, "clock": ts }
+
+
+class ZabbixSender:
+    """
+        Pushes sampling cycles to Zabbix trapper from the event loop.
+        Requests are queued and sent by a single task over a connection
+        kept open between cycles. While the trapper is unavailable the
+        task reconnects with exponential backoff, and the queue keeps
+        last `queue_max' cycles.
+    """
+    def __init__(self, server: str, port: int = ZABBIX_PORT, host: str = ZABBIX_HOST,
+            queue_max: int = sender_queue_max, retry_min: float = sender_retry_min,
+            retry_max: float = sender_retry_max, timeout: float = SENDER_TIMEOUT):
+        self.server = server
+        self.port = port
+        self.host = host or socket.gethostname()
+        self.queue = collections.deque(maxlen=queue_max)
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.timeout = timeout
+        self.backoff = retry_min
+        self.reader = self.writer = None
+        self.task = None
+        self.sent = 0
+        self.dropped = 0
+
+    def send(self, ts: float, names, bundles: dict) -> None:
+        """
+            Queue the cycle and start sending it, never blocks, must be
+            called from the running loop
+        """
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+            logging.warning("sender queue is full, dropping cycle of %s",
+                    self.queue[0][0])
+        self.queue.append((int(ts), encode(sender_data(self.host, names, int(ts), bundles))))
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> None:
+        """ Send queued cycles in order until the queue is empty """
+        while self.queue:
+            ts, packet = self.queue[0]
+            if self.reader is not None and self.reader.at_eof():
+                # Zabbix server closes connection after each response
+                self.disconnect()
+            reused = self.writer is not None
+            try:
+                if not reused:
+                    await self.connect()
+                response = await asyncio.wait_for(self.exchange(packet), self.timeout)
+            except (OSError, EOFError, ProtocolError, asyncio.TimeoutError) as e:
+                self.disconnect()
+                if reused:
+                    # trapper may close idle connection, retry with a new one
+                    continue
+                logging.warning("cannot send cycle of %s to %s:%s: %s, retry in %ss",
+                        ts, self.server, self.port, str(e) or type(e).__name__, self.backoff)
+                await asyncio.sleep(self.backoff)
+                self.backoff = min(self.backoff * 2, self.retry_max)
+                continue
+            self.queue.popleft()
+            self.backoff = self.retry_min
+            self.sent += 1
+            if response.get("response") != "success":
+                logging.warning("trapper rejected cycle of %s: %s", ts, response)
+            else:
+                logging.debug("cycle of %s sent: %s", ts, response.get("info"))
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.server, self.port), self.timeout)
+
+    async def exchange(self, packet: bytes) -> dict:
+        """ Send one packet and return decoded response """
+        self.writer.write(packet)
+        await self.writer.drain()
+        try:
+            length = decode_header(await self.reader.readexactly(HEADER_LEN))
+            return json.loads((await self.reader.readexactly(length)).decode())
+        except asyncio.IncompleteReadError as e:
+            raise EOFError("connection closed by trapper") from e
+        except ValueError as e:
+            raise ProtocolError("bad response: {}".format(e)) from e
+
+    def disconnect(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def close(self) -> None:
+        """ Stop sending, queued cycles are lost """
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        writer = self.writer
+        self.disconnect()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+import asyncio
+import json
+import logging
+import os
+import time
+from zaggregator import sqlite
+from zaggregator.output import discovery_json, all_json
+from zaggregator.config import metrics, sock_line_max
+
+# order of values in rows stored by the daemon, after the bundle name
+FIELDS = "rss", "vms", "ctxvol", "ctxinvol", "pcpu"
+
+class LatestValues:
+    """
+        In-memory copy of the last values of each bundle, same as the
+        `latest' table of the sqlite database
+    """
+    def __init__(self):
+        # name -> (ts, (rss, vms, ctxvol, ctxinvol, pcpu))
+        self.bundles = {}
+
+    def update(self, ts: float, rows) -> None:
+        """
+            Store rows (name, rss, vms, ctxvol, ctxinvol, pcpu) of the
+            sampling cycle with unix time `ts'
+        """
+        for row in rows:
+            self.bundles[row[0]] = (ts, tuple(row[1:]))
+
+    def prune(self, max_age: float) -> None:
+        """ Forget bundles not seen for `max_age' seconds """
+        before = time.time() - max_age
+        self.bundles = { name: v for name, v in self.bundles.items() if v[0] >= before }
+
+    def names(self) -> [str]:
+        return sorted(self.bundles)
+
+    def all(self) -> (int, dict):
+        """
+            Returns unix time of the last cycle and {name: {metric: value}}
+            of bundles updated by the last cycle
+        """
+        if not self.bundles:
+            return None, {}
+        ts = max(v[0] for v in self.bundles.values())
+        if time.time() - ts >= sqlite.STALE_AFTER:
+            return int(ts), {}
+        fields = [ FIELDS.index(sqlite.COLUMNS[m]) for m in metrics ]
+        return int(ts), { name: dict(zip(metrics, (values[f] for f in fields)))
+                for name, (bts, values) in self.bundles.items() if bts == ts }
+
+    def get(self, bname: str, check: str):
+        """
+            Get value of `check' variable for bundle with name `bname',
+            None if it's unknown or stale
+        """
+        field = FIELDS.index(sqlite.COLUMNS[check])
+        ts, values = self.bundles.get(bname, (None, None))
+        if ts is not None and time.time() - ts < sqlite.STALE_AFTER:
+            return values[field]
+
+
+class QueryServer:
+    """
+        Serves zcheck queries from LatestValues over UNIX socket, one
+        command per line, one JSON encoded response line per command:
+
+            discover                -> Zabbix autodiscovery JSON
+            get <bundle> <check>    -> value or null
+            all                     -> autodiscovery and all metrics
+            stats                   -> sampling cycles timing
+    """
+    def __init__(self, latest: LatestValues, stats=None):
+        self.latest = latest
+        self.stats = stats
+        self.server = None
+
+    def query(self, line: str) -> str:
+        """
+            Returns response for the command line
+        """
+        cmd, _, args = line.strip().partition(" ")
+        try:
+            if cmd == "discover":
+                return discovery_json(self.latest.names())
+            elif cmd == "get":
+                # bundle name is everything before the last word
+                bname, check = args.rsplit(" ", 1)
+                return json.dumps(self.latest.get(bname, check))
+            elif cmd == "all":
+                return all_json(self.latest.names(), *self.latest.all())
+            elif cmd == "stats":
+                return json.dumps(self.stats.as_dict() if self.stats else {})
+        except (ValueError, KeyError):
+            return json.dumps({ "error": "bad arguments: {}".format(line.strip()) })
+        return json.dumps({ "error": "unknown command: {}".format(cmd) })
+
+    def protocol(self):
+        return QueryProtocol(self)
+
+    async def start(self, path: str) -> None:
+        """
+            Start listening on UNIX socket `path', replacing socket left
+            by previous run
+        """
+        if os.path.exists(path):
+            os.unlink(path)
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_unix_server(self.protocol, path=path)
+        # zabbix agent runs zcheck as another user
+        os.chmod(path, 0o666)
+        logging.debug("listening on %s", path)
+
+    def close(self) -> None:
+        if self.server is not None:
+            for sock in self.server.sockets:
+                path = sock.getsockname()
+                if path and os.path.exists(path):
+                    os.unlink(path)
+            self.server.close()
+
+
+class QueryProtocol(asyncio.Protocol):
+    """
+        Connection to QueryServer, answers each complete command line as
+        soon as it arrives, without a task per connection. Connections
+        sending lines longer than sock_line_max are closed.
+    """
+    def __init__(self, server: QueryServer):
+        self.server = server
+        self.transport = None
+        self.buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data: bytes):
+        if self.transport.is_closing():
+            return
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            # undecodable bytes end up in the error response
+            line = line.decode(errors="replace")
+            self.transport.write(self.server.query(line).encode() + b"\n")
+        # socket is open to every local user
+        if len(self.buffer) > sock_line_max:
+            logging.warning("command line longer than %d bytes, closing connection",
+                    sock_line_max)
+            self.buffer = b""
+            self.transport.close()
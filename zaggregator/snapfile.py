@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+import mmap
+import os
+import struct
+import time
+from zaggregator.config import STALE_AFTER
+
+# Last values of bundles for zcheck, read without sqlite, socket round
+# trip or locking. The file is header (magic, version, unix time of the
+# cycle, records count), records sorted by bundle name (offset and length
+# of the name, unix time of the values, rss, vms, ctxvol, ctxinvol, pcpu)
+# and UTF-8 bundle names one after another. The daemon writes a new file
+# and renames it over the old one, so readers always see a complete one.
+MAGIC = b"ZAGS"
+VERSION = 1
+HEADER = struct.Struct("<4sIqI")
+RECORD = struct.Struct("<IHxxqqqqqd")
+# metric names as in zaggregator.config.metrics and samples columns to
+# the values of a record, after the name offset, length and the time
+FIELDS = {
+        "rss": 0,
+        "vms": 1,
+        "ctx_vol": 2,
+        "ctx_invol": 3,
+        "ctxvol": 2,
+        "ctxinvol": 3,
+        "pcpu": 4,
+        }
+
+def write(path: str, ts: float, bundles: dict) -> None:
+    """
+        Atomically replace snapshot at `path' with `bundles' {name: (ts,
+        (rss, vms, ctxvol, ctxinvol, pcpu))} of the cycle with unix time
+        `ts', same as LatestValues.bundles
+    """
+    records, names, offset = [], [], 0
+    for name, (bts, values) in sorted((n.encode(), v) for n, v in bundles.items()):
+        rss, vms, ctxvol, ctxinvol, pcpu = values
+        records.append(RECORD.pack(offset, len(name), int(bts),
+            rss, vms, ctxvol, ctxinvol, float(pcpu)))
+        names.append(name)
+        offset += len(name)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fd:
+        fd.write(HEADER.pack(MAGIC, VERSION, int(ts), len(records)))
+        fd.write(b"".join(records))
+        fd.write(b"".join(names))
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+class BadSnapshot(Exception): pass
+
+class Snapshot:
+    """
+        Read-only view of a snapshot file, lookups binary search the
+        records in the mapped file
+    """
+    def __init__(self, path: str):
+        with open(path, "rb") as fd:
+            self.buf = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buf) < HEADER.size:
+            raise BadSnapshot("truncated header")
+        magic, version, self.ts, self.count = HEADER.unpack_from(self.buf)
+        if magic != MAGIC or version != VERSION:
+            raise BadSnapshot("unsupported format {!r} {}".format(magic, version))
+        self.names_at = HEADER.size + self.count * RECORD.size
+        if len(self.buf) < self.names_at:
+            raise BadSnapshot("truncated records")
+
+    def close(self) -> None:
+        self.buf.close()
+
+    def fresh(self) -> bool:
+        """ True if the daemon has written the snapshot recently """
+        return time.time() - self.ts < STALE_AFTER
+
+    def name(self, i: int) -> bytes:
+        offset, length = RECORD.unpack_from(self.buf, HEADER.size + i * RECORD.size)[:2]
+        return self.buf[self.names_at + offset:self.names_at + offset + length]
+
+    def names(self) -> [str]:
+        return [ self.name(i).decode() for i in range(self.count) ]
+
+    def get(self, bname: str, check: str):
+        """
+            Get value of `check' variable for bundle with name `bname',
+            None if it's unknown or stale
+        """
+        field = FIELDS[check]
+        key = bname.encode()
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count or self.name(lo) != key:
+            return None
+        record = RECORD.unpack_from(self.buf, HEADER.size + lo * RECORD.size)
+        if time.time() - record[2] < STALE_AFTER:
+            return record[3 + field]
+
+    def all(self, checks) -> (int, dict):
+        """
+            Returns unix time of the last cycle and {name: {check: value}}
+            of bundles stored by the last cycle, same as sqlite.get_all()
+        """
+        fields = [ FIELDS[c] for c in checks ]
+        bundles = {}
+        for i in range(self.count):
+            record = RECORD.unpack_from(self.buf, HEADER.size + i * RECORD.size)
+            if record[2] == self.ts:
+                bundles[self.name(i).decode()] = dict(zip(checks,
+                    (record[3 + f] for f in fields)))
+        return self.ts, bundles
+
+def open_snapshot(path: str):
+    """
+        Returns Snapshot of a fresh file at `path', None if the daemon
+        doesn't write it
+    """
+    try:
+        snapshot = Snapshot(path)
+    except (OSError, ValueError, BadSnapshot):
+        return None
+    if not snapshot.fresh():
+        snapshot.close()
+        return None
+    return snapshot
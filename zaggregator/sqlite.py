@@ -1,80 +1,265 @@
 import sqlite3
+import time
+import urllib.parse
+from zaggregator.config import STALE_AFTER
 
 DBPATH="/var/run/zaggregator/zaggregator.sqlite"
+# seconds zcheck waits for a lock before giving up
+BUSY_TIMEOUT = 5.0
+# page cache of the daemon's connection, KiB
+CACHE_SIZE = 8192
+# PRAGMA user_version of the current schema
+SCHEMA_VERSION = 1
 db = None
 
-def __init__(dbpath=DBPATH) -> None:
+SCHEMA = """
+    CREATE TABLE
+    IF NOT EXISTS
+    bundles (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        first_seen INT,
+        last_seen INT
+    );
+    CREATE TABLE
+    IF NOT EXISTS
+    samples (
+        bundle_id INT NOT NULL,
+        ts INT NOT NULL,
+        rss INT,
+        vms INT,
+        ctxvol INT,
+        ctxinvol INT,
+        pcpu REAL
+    );
+    CREATE INDEX IF NOT EXISTS
+    samples_bundle_ts ON samples (bundle_id, ts);
+    CREATE TABLE
+    IF NOT EXISTS
+    latest (
+        bundle_id INTEGER PRIMARY KEY,
+        ts INT,
+        rss INT,
+        vms INT,
+        ctxvol INT,
+        ctxinvol INT,
+        pcpu REAL
+    );
+    """
+
+# version 0: samples keyed by bundle name with text timestamps, latest
+# keyed by bundle name, both renamed to *_v0 before migration
+MIGRATE_V0 = """
+    INSERT INTO bundles (name, first_seen, last_seen)
+        SELECT name, MIN(CAST(strftime('%s', ts) AS INT)),
+            MAX(CAST(strftime('%s', ts) AS INT))
+        FROM samples_v0 GROUP BY name;
+    INSERT INTO samples (bundle_id, ts, rss, vms, ctxvol, ctxinvol, pcpu)
+        SELECT bundles.id, CAST(strftime('%s', s.ts) AS INT),
+            s.rss, s.vms, s.ctxvol, s.ctxinvol, s.pcpu
+        FROM samples_v0 AS s JOIN bundles ON bundles.name = s.name;
+    DROP TABLE samples_v0;
+    """
+MIGRATE_V0_LATEST = """
+    INSERT OR IGNORE INTO bundles (name, first_seen, last_seen)
+        SELECT name, ts, ts FROM latest_v0;
+    UPDATE bundles SET last_seen = MAX(last_seen,
+        (SELECT ts FROM latest_v0 WHERE latest_v0.name = bundles.name))
+        WHERE name IN (SELECT name FROM latest_v0);
+    INSERT INTO latest (bundle_id, ts, rss, vms, ctxvol, ctxinvol, pcpu)
+        SELECT bundles.id, l.ts, l.rss, l.vms, l.ctxvol, l.ctxinvol, l.pcpu
+        FROM latest_v0 AS l JOIN bundles ON bundles.name = l.name;
+    DROP TABLE latest_v0;
+    """
+
+def connect(dbpath=DBPATH, readonly=False) -> sqlite3.Connection:
+    """
+        Open sqlite database. The daemon opens it for writing in WAL mode,
+        so readers and the writer never block each other, and creates or
+        migrates the schema. Readers (zcheck) open it read-only with a
+        busy timeout.
+    """
+    if readonly:
+        uri = "file:{}?mode=ro".format(urllib.parse.quote(dbpath))
+        return sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT)
+
+    conn = sqlite3.connect(dbpath, timeout=BUSY_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    # in WAL mode a commit is durable after the next checkpoint only,
+    # losing the last cycle on power failure is fine for us
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA cache_size=-{};".format(CACHE_SIZE))
+    upgrade(conn)
+    return conn
+
+def upgrade(conn: sqlite3.Connection) -> None:
+    """
+        Create the schema or migrate it from older versions in a single
+        transaction
+    """
+    version = conn.execute("PRAGMA user_version;").fetchone()[0]
+    if version == SCHEMA_VERSION:
+        return
+
+    tables = set(row[0] for row in
+            conn.execute("SELECT name FROM sqlite_master WHERE type='table';"))
+    conn.execute("BEGIN;")
+    try:
+        if version == 0:
+            # zaggregator up to 0.0.10 used the trigger for retention
+            conn.execute("DROP TRIGGER IF EXISTS DELETE_TAIL;")
+            for table in ("samples", "latest"):
+                if table in tables:
+                    conn.execute("ALTER TABLE {0} RENAME TO {0}_v0;".format(table))
+            conn.execute("DROP INDEX IF EXISTS samples_name_ts;")
+        for statement in SCHEMA.split(";"):
+            conn.execute(statement)
+        if version == 0:
+            if "samples" in tables:
+                for statement in MIGRATE_V0.split(";"):
+                    conn.execute(statement)
+            if "latest" in tables:
+                for statement in MIGRATE_V0_LATEST.split(";"):
+                    conn.execute(statement)
+        conn.execute("PRAGMA user_version={};".format(SCHEMA_VERSION))
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+
+def __init__(dbpath=DBPATH, readonly=False) -> None:
     """ Initalize sqlite dataabase """
     global db
-    db = sqlite3.connect(dbpath)
-    create_table_str = """
-        CREATE TABLE
-        IF NOT EXISTS
-        samples (
-            ts DATETIME DEFAULT CURRENT_TIMESTAMP,
-            name TEXT,
-            rss INT,
-            vms INT,
-            ctxvol INT,
-            ctxinvol INT,
-            pcpu REAL
-        );
-        """;
-    create_trigger = """
-        CREATE TRIGGER IF NOT EXISTS
-        DELETE_TAIL
-        AFTER INSERT ON samples
-        BEGIN
-            DELETE FROM samples WHERE ts not in (select ts from samples order by ts desc
-            limit 300);
-        END;
-    """
-    db.execute(create_table_str)
-    db.execute(create_trigger)
+    db = connect(dbpath, readonly)
 
 class BadRecord(Exception): pass
 
+INSERT_BUNDLE = """
+    INSERT OR IGNORE INTO bundles (name, first_seen, last_seen)
+    VALUES (?, ?, ?);
+    """
+TOUCH_BUNDLE = """
+    UPDATE bundles SET last_seen = ? WHERE name = ?;
+    """
+INSERT = """
+    INSERT INTO samples
+    ( bundle_id, ts, rss, vms, ctxvol, ctxinvol, pcpu )
+    SELECT id, ?, ?, ?, ?, ?, ? FROM bundles WHERE name = ?;
+    """
+UPSERT_LATEST = """
+    INSERT OR REPLACE INTO latest
+    ( bundle_id, ts, rss, vms, ctxvol, ctxinvol, pcpu )
+    SELECT id, ?, ?, ?, ?, ?, ? FROM bundles WHERE name = ?;
+    """
+# metric names as in zaggregator.config.metrics to samples columns
+COLUMNS = {
+        "rss": "rss",
+        "vms": "vms",
+        "ctx_vol": "ctxvol",
+        "ctx_invol": "ctxinvol",
+        "ctxvol": "ctxvol",
+        "ctxinvol": "ctxinvol",
+        "pcpu": "pcpu",
+        }
+
+def add_records(cycle_ts: float, rows) -> None:
+    """
+        Add rows (name, rss, vms, ctxvol, ctxinvol, pcpu) of one sampling
+        cycle into sqlite database in a single transaction, all rows get
+        the same timestamp `cycle_ts' (unix time). Last values of the
+        bundles are updated in the same transaction.
+    """
+    if not rows:
+        return
+    ts = int(cycle_ts)
+    params = []
+    for record in rows:
+        if len(record) != 6:
+            raise BadRecord
+        params.append((ts,) + tuple(record[1:]) + (record[0],))
+    with db:
+        db.executemany(INSERT_BUNDLE, [ (r[0], ts, ts) for r in rows ])
+        db.executemany(TOUCH_BUNDLE, [ (ts, r[0]) for r in rows ])
+        db.executemany(INSERT, params)
+        db.executemany(UPSERT_LATEST, params)
+
 def add_record(record) -> None:
     """
         Add record into sqlite database
     """
     if len(record) != 3 and hasattr(record, "__iter__"):
-        query = """
-            INSERT INTO samples
-            ( name, rss, vms, ctxvol, ctxinvol, pcpu )
-            VALUES ('{}',{});""".format(record[0], ",".join(map(str, record[1:])))
-
-        db.execute(query)
-        db.commit()
+        add_records(time.time(), [ record ])
     else:
         raise BadRecord
 
-def get_bundle_names() -> [str]:
+def prune(max_age: float = None, max_cycles: int = None) -> int:
     """
-        Get list of bundle names from sqlite database
+        Delete samples older than `max_age' seconds and samples beyond
+        `max_cycles' latest ones of each bundle in one transaction,
+        returns number of deleted rows. Bundles not seen for `max_age'
+        are forgotten.
+    """
+    deleted = 0
+    with db:
+        ids = [ row[0] for row in db.execute("SELECT id FROM bundles;") ]
+        for bundle_id in ids:
+            if max_age is not None:
+                deleted += db.execute(
+                        "DELETE FROM samples WHERE bundle_id=? AND ts < ?;",
+                        (bundle_id, int(time.time() - max_age))).rowcount
+            if max_cycles:
+                # timestamp of the oldest sample to keep, NULL if there
+                # are less samples, so nothing is deleted
+                deleted += db.execute("""
+                    DELETE FROM samples WHERE bundle_id=? AND ts < (
+                        SELECT ts FROM samples WHERE bundle_id=?
+                        ORDER BY ts DESC LIMIT 1 OFFSET ?);
+                    """, (bundle_id, bundle_id, max_cycles - 1)).rowcount
+        if max_age is not None:
+            # all their samples are older than last_seen and gone already
+            before = int(time.time() - max_age)
+            db.execute("""
+                DELETE FROM latest WHERE bundle_id IN (
+                    SELECT id FROM bundles WHERE last_seen < ?);
+                """, (before,))
+            db.execute("DELETE FROM bundles WHERE last_seen < ?;", (before,))
+    return deleted
+
+def get_bundle_names(max_age: float = None) -> [str]:
+    """
+        Get list of bundle names from sqlite database, only bundles seen
+        in last `max_age' seconds if set
     """
     query = """
-        SELECT DISTINCT(name) FROM samples;
+        SELECT name FROM bundles WHERE last_seen >= ? ORDER BY name;
         """
-    return [ row[0] for row in db.execute(query) ]
+    since = int(time.time() - max_age) if max_age is not None else 0
+    return [ row[0] for row in db.execute(query, (since,)) ]
+
+def get_all(checks) -> (int, dict):
+    """
+        Returns unix time of the last cycle and {name: {check: value}}
+        of bundles stored by the last cycle
+    """
+    ts = db.execute("SELECT MAX(ts) FROM latest;").fetchone()[0]
+    if ts is None or time.time() - ts >= STALE_AFTER:
+        return ts, {}
+    query = """
+        SELECT bundles.name, {} FROM latest
+        JOIN bundles ON bundles.id = latest.bundle_id
+        WHERE latest.ts = ?;
+        """.format(", ".join("latest." + COLUMNS[c] for c in checks))
+    return ts, { row[0]: dict(zip(checks, row[1:])) for row in db.execute(query, (ts,)) }
 
 def get(bname:str, check:str):
     """
         Get value of `check' variable for bundle with name `bname'
     """
     query = """
-        SELECT {} FROM samples
-        WHERE name='{}' AND
-            ( (julianday('now') - julianday(ts))*24*60*60 < 30 )
-        ORDER BY ts DESC
-        LIMIT 1;
-        """.format(check, bname)
-    result = list(db.execute(query))
-    if len(result) > 0:
-        return result[0][0]
-
-try:
-    __init__(dbpath=DBPATH)
-except sqlite3.OperationalError as e:
-    # late init
-    pass
+        SELECT latest.{}, latest.ts FROM bundles
+        JOIN latest ON latest.bundle_id = bundles.id
+        WHERE bundles.name=?;
+        """.format(COLUMNS[check])
+    result = db.execute(query, (bname,)).fetchone()
+    if result and time.time() - result[1] < STALE_AFTER:
+        return result[0]
@@ -105,6 +105,64 @@ class BunchProto:
         if psutil.Process(pid=self.master.pid).is_running():
             self.master.terminate()
 
+class StaticScanner:
+    """
+        Scanner replaying predefined cycles of ProcRecords, one cycle per
+        scan() call, and emulating skipped cmdline reads for known processes
+    """
+    def __init__(self, *cycles, interval=30.0):
+        self.cycles = list(cycles)
+        self.interval = interval
+        self.ncycle = -1
+        self.cmdline_reads = 0
+
+    def scan(self, known=None):
+        self.ncycle += 1
+        records = []
+        for r in self.cycles[min(self.ncycle, len(self.cycles)-1)]:
+            if known and known.get((r.pid, r.start)) == r.name:
+                r = r._replace(cmdline=None)
+            else:
+                self.cmdline_reads += 1
+            records.append(r)
+        return records
+
+    def uptime(self):
+        return 1000.0 + self.ncycle * self.interval
+
+    cpu_total = uptime
+
+def record(pid, ppid, pgid, cmdline, rss=1024, cpu_time=1.0, start=None, name=None):
+    """ Shortcut to create zaggregator.procscan.ProcRecord for tests """
+    from zaggregator.procscan import ProcRecord
+    return ProcRecord(pid=pid, ppid=ppid, pgid=pgid,
+            name=name or (os.path.basename(cmdline[0]) if cmdline else ""),
+            cmdline=cmdline, rss=rss, vms=rss*2, ctx_vol=10, ctx_invol=1,
+            start=float(pid) if start is None else start, cpu_time=cpu_time)
+
+def fuzzy_pairs(string_sets, npairs=10000, seed=0):
+    """
+        Pairs of process names for fuzzy matching: siblings from one of
+        `string_sets' and names from different sets, with numbers and
+        random tokens varied like pids, worker numbers and proctitles
+    """
+    rnd = random.Random(seed)
+    def vary(name):
+        name = "".join(rnd.choice(string.digits) if c.isdigit() else c for c in name)
+        if rnd.random() < 0.2:
+            token = "".join(rnd.choice(string.ascii_uppercase + string.digits) for i in range(8))
+            name = rnd.choice((token + ": " + name, name + " " + token))
+        return name
+    names = [ n for names in string_sets for n in names ]
+    pairs = []
+    while len(pairs) < npairs:
+        if rnd.random() < 0.5:
+            a, b = rnd.sample(rnd.choice(string_sets), 2)
+        else:
+            a, b = rnd.sample(names, 2)
+        pairs.append((vary(a), vary(b)))
+    return pairs
+
 def cycle():
     # singleton, which does nothing, only consumes CPU
     import signal
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+    fuzzy_match benchmark on pairs of process names built from the
+    string sets of test_utils: plain fuzz.partial_ratio with eager debug
+    message, the first cycle with empty cache and the next cycles
+
+    $ python -m zaggregator.tests.bench_fuzzy [npairs]
+"""
+import sys
+import time
+import logging
+from fuzzywuzzy import fuzz
+import zaggregator.utils as utils
+import zaggregator.tests as tests
+from zaggregator.tests.test_utils import TestZaggregatorUtils
+
+def fuzzy_match_plain(a, b, threshold=utils.DEFAULT_FUZZY_THRESHOLD):
+    """ fuzzy_match before the prefilters and the cache """
+    score = fuzz.partial_ratio(a,b)
+    logging.debug("Fuzzy score: {} ({},{})".format(score, a, b))
+    return score > threshold
+
+def timed(func, pairs):
+    start = time.perf_counter()
+    result = [ func(a, b) for a, b in pairs ]
+    return time.perf_counter() - start, result
+
+if __name__ == '__main__':
+    npairs = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    logging.getLogger().setLevel(logging.WARNING)
+    pairs = tests.fuzzy_pairs(TestZaggregatorUtils.fuzzy_string_sets +
+            TestZaggregatorUtils.fuzzy_string_sets_nomatch, npairs)
+
+    plain, expected = timed(fuzzy_match_plain, pairs)
+    utils._fuzzy_match.cache_clear()
+    decided = sum(utils.fuzzy_prefilter(a, b, utils.DEFAULT_FUZZY_THRESHOLD) is not None
+            for a, b in pairs)
+    first, result = timed(utils.fuzzy_match, pairs)
+    assert result == expected
+    cached, result = timed(utils.fuzzy_match, pairs)
+    assert result == expected
+
+    print("{} pairs, {} distinct, {} decided by prefilters".format(npairs,
+        len(set(pairs)), decided))
+    for name, elapsed in (("partial_ratio", plain), ("first cycle", first),
+            ("next cycles", cached)):
+        print("{:<14} {:8.2f} ms  {:6.2f} us/pair".format(name, elapsed * 1000,
+            elapsed * 1e6 / npairs))
+    print(utils._fuzzy_match.cache_info())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+    ProcessMirror microbenchmark on a synthetic table of 10k processes:
+    construction time, memory per mirror and attribute access cost
+
+    $ python -m zaggregator.tests.bench_procmirror [nprocs]
+"""
+import sys
+import time
+import tracemalloc
+from zaggregator.procscan import ProcRecord
+from zaggregator.proctable import ProcTable
+from zaggregator.procmirror import ProcessMirror
+
+def synthetic_records(nprocs):
+    """ Process groups of ten: a leader and nine of its children """
+    records = []
+    for pid in range(100, 100 + nprocs):
+        leader = pid - pid % 10
+        records.append(ProcRecord(pid=pid, ppid=1 if pid == leader else leader,
+            pgid=leader, name="worker", cmdline=["worker: {}".format(pid), "", ""],
+            rss=pid * 4096, vms=pid * 8192, ctx_vol=pid, ctx_invol=1,
+            start=float(pid), cpu_time=1.0))
+    return records
+
+def synthetic_table(records):
+    """ Bare ProcTable with snapshot indexes only, without bundling """
+    pt = ProcTable.__new__(ProcTable)
+    pt._children = {}
+    for r in records: pt._children.setdefault(r.ppid, []).append(r.pid)
+    pt.mirrors = {}
+    return pt
+
+def timed(func, rounds=5):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+if __name__ == '__main__':
+    nprocs = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    records = synthetic_records(nprocs)
+    pt = synthetic_table(records)
+
+    tracemalloc.start()
+    mirrors = [ ProcessMirror(r, pt) for r in records ]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pt.mirrors = { m.pid: m for m in mirrors }
+
+    results = (
+        ("construct", timed(lambda: [ ProcessMirror(r, pt) for r in records ])),
+        ("getattr rss", timed(lambda: [ getattr(p, "rss") for p in mirrors ])),
+        ("_pgid", timed(lambda: [ p._pgid for p in mirrors ])),
+        ("cmdline()", timed(lambda: [ p.cmdline() for p in mirrors ])),
+        ("parent()", timed(lambda: [ p.parent() for p in mirrors ])),
+        ("children()", timed(lambda: [ p.children() for p in mirrors ])),
+        )
+    print("{} mirrors, {:.0f} bytes per mirror".format(nprocs, size / nprocs))
+    for name, elapsed in results:
+        print("{:<12} {:8.2f} ms  {:6.3f} us/mirror".format(name, elapsed * 1000,
+            elapsed * 1e6 / nprocs))
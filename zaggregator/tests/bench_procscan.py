@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+    Compare process table collection time of zaggregator.procscan backends:
+    bare scan, scan with ProcessMirror construction and the whole ProcTable
+
+    $ python -m zaggregator.tests.bench_procscan [rounds]
+"""
+import sys
+import time
+from zaggregator.procscan import LinuxScanner, PsutilScanner
+from zaggregator.proctable import ProcTable
+from zaggregator.procmirror import ProcessMirror
+
+def best_of(func, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def mirrors(scanner):
+    pt = ProcTable.__new__(ProcTable)
+    records = scanner.scan()
+    pt._children = {}
+    for r in records: pt._children.setdefault(r.ppid, []).append(r.pid)
+    return [ ProcessMirror(r, pt) for r in records ]
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print("{:<16} {:>6} {:>12} {:>12} {:>12}".format(
+        "backend", "procs", "scan, ms", "mirrors, ms", "ProcTable, ms"))
+    for scanner in (PsutilScanner(), LinuxScanner()):
+        nprocs = len(scanner.scan())
+        print("{:<16} {:>6} {:>12.2f} {:>12.2f} {:>12.2f}".format(
+            scanner.__class__.__name__, nprocs,
+            best_of(scanner.scan, rounds) * 1000,
+            best_of(lambda: mirrors(scanner), rounds) * 1000,
+            best_of(lambda: ProcTable(scanner=scanner), rounds) * 1000))
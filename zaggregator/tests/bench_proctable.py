@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+    ProcTable benchmark on synthetic process trees of 100 to 50k pids:
+    wall time, peak memory and number of function calls of each phase of
+    the first cycle and of the next cycles, stored as JSON to compare runs
+
+    $ python -m zaggregator.tests.bench_proctable -o before.json
+    $ python -m zaggregator.tests.bench_proctable -o after.json -c before.json
+"""
+import argparse
+import cProfile
+import json
+import platform
+import pstats
+import time
+import tracemalloc
+from zaggregator.tests import StaticScanner
+from zaggregator.tests.synthetic import synthetic_cycles, PATTERNS
+from zaggregator.proctable import ProcTable
+from zaggregator.pcpu import CpuSampler
+from zaggregator.config import metrics, top_k
+
+SIZES = 100, 1000, 10000, 50000
+PHASES = "scan", "mirroring", "pcpu", "bundling", "dedup", "aggregate", "top-k", "other"
+# ProcTable methods and the phases they belong to
+METHODS = (
+        ("_mirror", "mirroring"),
+        ("_adopt", "bundling"),
+        ("_bundle", "bundling"),
+        ("_merge_duplicates", "dedup"),
+        ("_aggregate", "aggregate"),
+        )
+# what is measured in a run and key of the result
+MODES = { "time": "ms", "memory": "peak_kib", "calls": "calls" }
+
+class PhaseMeter:
+    """
+        Accumulates one measure of wrapped calls by phase: wall time,
+        tracemalloc peak over the memory allocated before the call or
+        number of function calls counted by cProfile
+    """
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.results = {}
+
+    def wrap(self, phase: str, func):
+        def wrapper(*args, **kwargs):
+            return self.measure(phase, func, *args, **kwargs)
+        return wrapper
+
+    def measure(self, phase: str, func, *args, **kwargs):
+        if phase == "total" and self.mode != "time":
+            # encloses the other phases, profilers and peaks don't nest
+            return func(*args, **kwargs)
+        if self.mode == "memory":
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        elif self.mode == "calls":
+            profile = cProfile.Profile()
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if self.mode == "time":
+                self.add(phase, (time.perf_counter() - start) * 1000)
+            elif self.mode == "memory":
+                self.results[phase] = max(self.results.get(phase, 0),
+                        (tracemalloc.get_traced_memory()[1] - base) / 1024)
+            else:
+                profile.disable()
+                self.add(phase, pstats.Stats(profile).total_calls)
+
+    def add(self, phase: str, value):
+        self.results[phase] = self.results.get(phase, 0) + value
+
+    def take(self) -> dict:
+        results, self.results = self.results, {}
+        return results
+
+def instrumented_table(cycles, meter: PhaseMeter) -> ProcTable:
+    """ ProcTable of the synthetic cycles with phases measured by `meter' """
+    scanner = StaticScanner(*cycles)
+    scanner.scan = meter.wrap("scan", scanner.scan)
+    sampler = CpuSampler()
+    sampler.sample = meter.wrap("pcpu", sampler.sample)
+    pt = ProcTable.__new__(ProcTable)
+    for method, phase in METHODS:
+        setattr(pt, method, meter.wrap(phase, getattr(pt, method)))
+    meter.measure("total", ProcTable.__init__, pt, scanner=scanner, cpu_sampler=sampler)
+    return pt
+
+def run(cycles, mode: str) -> (dict, dict, int):
+    """
+        Returns phases of the first cycle and phases of the next cycles
+        on average, measured in `mode', and number of bundles
+    """
+    meter = PhaseMeter(mode)
+    pt = instrumented_table(cycles, meter)
+    meter.measure("top-k", pt.get_top, top_k, metrics, True)
+    first = meter.take()
+    for n in range(1, len(cycles)):
+        meter.measure("total", pt.update)
+        meter.measure("top-k", pt.get_top, top_k, metrics, True)
+    nexts = { phase: value / max(1, len(cycles) - 1)
+            for phase, value in meter.take().items() }
+    return first, nexts, len(pt.bundles)
+
+def bench(npids: int, args) -> dict:
+    cycles = synthetic_cycles(npids, args.cycles + 1, args.churn, depth=args.depth,
+            fanout=args.fanout, patterns=args.patterns, seed=args.seed)
+    result = { "npids": npids, "first": {}, "next": {} }
+    for mode, key in MODES.items():
+        if mode == "memory":
+            tracemalloc.start()
+        first, nexts, result["bundles"] = run(cycles, mode)
+        if mode == "memory":
+            tracemalloc.stop()
+        for cycle, phases in (("first", first), ("next", nexts)):
+            if mode == "time":
+                # rest of the cycle, "total" doesn't include top-k
+                phases["other"] = phases.pop("total") - sum(v for p, v in
+                        phases.items() if p != "top-k")
+            for phase in PHASES:
+                value = phases.get(phase, 0 if phase != "other" else None)
+                result[cycle].setdefault(phase, {})[key] = \
+                        round(value, 3) if value is not None else None
+    return result
+
+def report(results: list, baseline: dict = None):
+    base = { r["npids"]: r for r in baseline["results"] } if baseline else {}
+    for r in results:
+        print("{} pids, {} bundles".format(r["npids"], r["bundles"]))
+        for cycle in ("first", "next"):
+            print("  {:<6} {:<10} {:>10} {:>10} {:>10}{}".format(cycle, "phase",
+                "ms", "peak KiB", "calls", "   ms vs baseline" if base else ""))
+            for phase in PHASES:
+                p = r[cycle][phase]
+                line = "  {:<6} {:<10} {:>10.2f} {:>10} {:>10}".format("", phase,
+                        p["ms"], "-" if p["peak_kib"] is None else "{:.1f}".format(p["peak_kib"]),
+                        "-" if p["calls"] is None else int(p["calls"]))
+                old = base.get(r["npids"], {}).get(cycle, {}).get(phase)
+                if old and old["ms"]:
+                    line += "   {:>6.2f}x".format(p["ms"] / old["ms"])
+                print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="ProcTable synthetic benchmark.")
+    parser.add_argument("-s", "--sizes", type=lambda s: [ int(n) for n in s.split(",") ],
+            default=SIZES, help="comma separated numbers of pids")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fanout", type=int, default=20)
+    parser.add_argument("--patterns", type=lambda s: s.split(","), default=PATTERNS)
+    parser.add_argument("--cycles", type=int, default=3, help="cycles after the first one")
+    parser.add_argument("--churn", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="store results as JSON")
+    parser.add_argument("-c", "--compare", help="JSON results of a previous run")
+    args = parser.parse_args()
+
+    results = [ bench(npids, args) for npids in args.sizes ]
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+    report(results, baseline)
+    if args.output:
+        document = { "python": platform.python_version(), "time": int(time.time()),
+                "params": { k: v for k, v in vars(args).items() if k not in ("output", "compare") },
+                "results": results }
+        with open(args.output, "w") as fd:
+            json.dump(document, fd, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+    reduce_sequence benchmark on pools of 10 to 5000 proctitles of
+    php-fpm and postgres workers, the common prefix against pairwise
+    SequenceMatcher reduction, which is quadratic and only run on pools
+    up to `max_pairwise' titles
+
+    $ python -m zaggregator.tests.bench_reduce [max_pairwise]
+"""
+import sys
+import time
+import random
+import zaggregator.utils as utils
+
+POOLS = 10, 50, 100, 500, 1000, 5000
+
+def pool(kind, ntitles, seed=0):
+    rnd = random.Random(seed)
+    if kind == "php-fpm":
+        return [ "php-fpm: pool {}".format(rnd.choice(("www", "www", "api")))
+                for i in range(ntitles) ]
+    return [ "postgres: app appdb 10.0.{}.{}({}) {}".format(rnd.randint(0, 9),
+        rnd.randint(1, 254), rnd.randint(30000, 60000), rnd.choice(("idle", "SELECT")))
+        for i in range(ntitles) ]
+
+def timed(func, seq):
+    start = time.perf_counter()
+    result = func(seq)
+    return time.perf_counter() - start, result
+
+if __name__ == '__main__':
+    max_pairwise = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print("{:<9} {:>6} {:>12} {:>12}  {}".format("pool", "titles", "prefix ms",
+        "pairwise ms", "name"))
+    for kind in ("php-fpm", "postgres"):
+        for ntitles in POOLS:
+            seq = pool(kind, ntitles)
+            elapsed, name = timed(utils.reduce_sequence, seq)
+            pairwise = "-"
+            if ntitles <= max_pairwise:
+                pelapsed, pname = timed(utils.reduce_sequence_pairwise, seq)
+                pairwise = "{:.2f}".format(pelapsed * 1000)
+                if pname != name:
+                    name = "{} (pairwise: {})".format(name, pname)
+            print("{:<9} {:>6} {:>12.3f} {:>12}  {}".format(kind, ntitles,
+                elapsed * 1000, pairwise, name))
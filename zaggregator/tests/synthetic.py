@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+    Synthetic process tables for benchmarks: ProcRecords of generated
+    process trees and their next cycles, fed to ProcTable through
+    zaggregator.tests.StaticScanner
+"""
+import random
+from zaggregator.tests import record
+
+# process title patterns of generated trees
+PATTERNS = "pool", "shell", "daemon", "kernel"
+POOLS = "php-fpm", "postgres", "nginx", "gunicorn", "httpd"
+DAEMONS = "cron", "sshd", "rsyslogd", "dbus-daemon", "zabbix_agentd"
+JOBS = "/usr/bin/make", "/bin/sh", "/usr/bin/python3", "/usr/bin/gcc", "sleep"
+# seconds after boot the generated processes are started within
+STARTED_WITHIN = 900.0
+
+class TreeGenerator:
+    """
+        Generates ProcRecords of a process tree of init, kernel threads
+        and process groups of `patterns':
+
+            pool    master with up to `fanout' workers sharing its process
+                    group, workers fork helpers down to `depth' levels
+            shell   login shell with up to `fanout' jobs in process groups
+                    of their own, pipelines `depth' processes long
+            daemon  single process in its own process group
+            kernel  kernel thread, child of kthreadd in process group 0
+    """
+    def __init__(self, depth=3, fanout=20, patterns=PATTERNS, seed=0):
+        self.depth = depth
+        self.fanout = fanout
+        self.patterns = patterns
+        self.rnd = random.Random(seed)
+        self.pid = 100
+        self.records = []
+
+    def add(self, ppid, pgid, cmdline, name=None):
+        pid = self.pid
+        self.pid += 1
+        self.records.append(record(pid, ppid, pgid, cmdline, name=name,
+            rss=self.rnd.randint(1, 1 << 18) * 1024,
+            cpu_time=self.rnd.random() * 100, start=0.0))
+        return pid
+
+    def pool(self):
+        name = self.rnd.choice(POOLS)
+        master = self.add(1, self.pid, [name + ": master process", "", ""])
+        for i in range(self.rnd.randint(1, self.fanout)):
+            ppid = self.add(master, master, [name + ": worker process", "", ""])
+            for level in range(self.rnd.randint(0, self.depth - 2)):
+                ppid = self.add(ppid, master, ["/bin/sh", "-c", "helper {}".format(level)])
+
+    def shell(self):
+        sh = self.add(1, self.pid, ["-bash"], name="bash")
+        for i in range(self.rnd.randint(0, self.fanout // 4)):
+            ppid = pgid = self.pid
+            for level in range(self.rnd.randint(1, self.depth)):
+                ppid = self.add(sh if level == 0 else ppid, pgid,
+                        [self.rnd.choice(JOBS), "job{}".format(i)])
+
+    def daemon(self):
+        self.add(1, self.pid, ["/usr/sbin/" + self.rnd.choice(DAEMONS), "-f"])
+
+    def kernel(self):
+        self.add(2, 0, [], name="kworker/{}".format(self.pid))
+
+    def generate(self, npids):
+        self.records = [ record(1, 0, 1, ["/sbin/init"], start=0.0),
+                record(2, 0, 0, [], name="kthreadd", start=0.0) ]
+        while len(self.records) < npids:
+            getattr(self, self.rnd.choice(self.patterns))()
+        records = self.records[:npids]
+        # parents are started before their children
+        for i, r in enumerate(records):
+            records[i] = r._replace(start=STARTED_WITHIN * r.pid / self.pid)
+        return records
+
+def synthetic_tree(npids, depth=3, fanout=20, patterns=PATTERNS, seed=0):
+    """
+        Returns ProcRecords of a generated process tree of `npids'
+        processes, see TreeGenerator
+    """
+    return TreeGenerator(depth, fanout, patterns, seed).generate(npids)
+
+def next_cycle(records, churn=0.05, now=1030.0, seed=0):
+    """
+        Returns records of the next sampling cycle: `churn' part of leaf
+        processes exit and as many new ones are forked by pool masters
+        and shells, survivors spend some CPU time and change their RSS
+    """
+    rnd = random.Random(seed)
+    parents = set(r.ppid for r in records)
+    leaves = [ r.pid for r in records if r.pid not in parents and r.pgid != 0 ]
+    gone = set(rnd.sample(leaves, min(len(leaves), int(len(records) * churn))))
+    forks = [ r for r in records if r.ppid == 1 and r.pid in parents ] or records[:1]
+
+    ret = []
+    for r in records:
+        if r.pid in gone:
+            continue
+        ret.append(r._replace(cpu_time=r.cpu_time + rnd.random() * 30,
+            rss=max(1024, r.rss + rnd.randint(-64, 64) * 1024)))
+    pid = max(r.pid for r in records) + 1
+    for i in range(len(gone)):
+        parent = rnd.choice(forks)
+        ret.append(record(pid, parent.pid, parent.pgid, parent.cmdline,
+            rss=parent.rss, cpu_time=rnd.random(), start=now - rnd.random() * 30))
+        pid += 1
+    return ret
+
+def synthetic_cycles(npids, ncycles=2, churn=0.05, interval=30.0, **kwargs):
+    """
+        Returns records of `ncycles' consecutive cycles of a generated
+        tree, in StaticScanner timing
+    """
+    cycles = [ synthetic_tree(npids, **kwargs) ]
+    for n in range(1, ncycles):
+        cycles.append(next_cycle(cycles[-1], churn, 1000.0 + n * interval, seed=n))
+    return cycles
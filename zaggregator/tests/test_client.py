@@ -0,0 +1,51 @@
+import unittest
+import inspect
+import logging
+import subprocess
+import sys
+
+import zaggregator.tests as tests
+
+# collector dependencies and sqlite, zcheck must not pay for them
+HEAVY = "psutil", "fuzzywuzzy", "Levenshtein", "zaggregator.procbundle", "sqlite3"
+
+def importtime(module: str) -> dict:
+    """
+        Returns {module: cumulative import time, us} for all modules
+        imported by `module' in a fresh interpreter
+    """
+    out = subprocess.run([ sys.executable, "-X", "importtime", "-c",
+        "import " + module ], stderr=subprocess.PIPE, universal_newlines=True,
+        check=True).stderr
+    ret = {}
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            ret[name.strip()] = int(cumulative)
+    return ret
+
+class TestClient(tests.TestCase):
+
+    def test_client_imports(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        imported = importtime("zaggregator.client")
+        logging.debug("zaggregator.client import time: %sus",
+                imported["zaggregator.client"])
+        for name in HEAVY:
+            self.assertNotIn(name, imported)
+
+    def test_package_attributes(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        import zaggregator
+        from zaggregator.proctable import ProcTable
+        from zaggregator.output import eprint
+        self.assertTrue(zaggregator.ProcTable is ProcTable)
+        self.assertTrue(zaggregator.eprint is eprint)
+        with self.assertRaises(AttributeError):
+            zaggregator.nonexistent
+
+
+if __name__ == '__main__':
+    tests.run_test_module_by_name(__file__)
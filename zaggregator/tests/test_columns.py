@@ -0,0 +1,55 @@
+import unittest
+import inspect
+import logging
+
+import zaggregator.tests as tests
+import zaggregator.columns as columns
+from zaggregator.columns import ProcColumns
+from zaggregator.procmirror import ProcessMirror
+
+
+def mirror(pid, rss, pcpu):
+    m = ProcessMirror(tests.record(pid, 1, pid, ["test"], rss=rss), None)
+    m.set_pcpu(pcpu)
+    return m
+
+class TestProcColumns(tests.TestCase):
+
+    procs = [ mirror(10, 1024, 1.5), mirror(11, 4096, 0.5), mirror(12, 2048, None) ]
+
+    def aggregate(self):
+        a, b, c = self.procs
+        pc = ProcColumns.from_groups([ [a, b], [c], [], [b, c] ])
+        self.assertEqual(list(pc.bundle), [0, 0, 1, 3, 3])
+        return pc.aggregate(4)
+
+    def test_aggregate(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        stats = self.aggregate()
+        self.assertEqual(stats["nprocs"], [2, 1, 0, 2])
+        self.assertEqual(stats["rss"], [5120, 2048, 0, 6144])
+        self.assertEqual(stats["rss_max"], [4096, 2048, 0, 4096])
+        self.assertEqual(stats["pcpu"], [2.0, 0.0, 0.0, 0.5])
+        self.assertEqual(stats["pcpu_max"], [1.5, 0.0, 0.0, 0.5])
+        self.assertIsInstance(stats["rss"][0], int)
+        self.assertIsInstance(stats["pcpu"][1], float)
+
+    def test_aggregate_unbundled(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        pc = ProcColumns(self.procs, [-1, 0, 0])
+        self.assertEqual(len(pc), 3)
+        self.assertEqual(pc.aggregate(1)["rss"], [6144])
+
+    @unittest.skipIf(columns.numpy is None, "numpy is not installed")
+    def test_aggregate_without_numpy(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        expected = self.aggregate()
+        numpy, columns.numpy = columns.numpy, None
+        try:
+            self.assertEqual(self.aggregate(), expected)
+        finally:
+            columns.numpy = numpy
+
+
+if __name__ == '__main__':
+    tests.run_test_module_by_name(__file__)
@@ -0,0 +1,125 @@
+import unittest
+import asyncio
+import inspect
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import zaggregator.tests as tests
+import zaggregator.daemon as daemon
+from zaggregator import snapfile
+
+
+class TestDaemon(tests.TestCase):
+
+    def test_next_tick(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        self.assertEqual(daemon.next_tick(1000.5, 30), 1020.0)
+        self.assertEqual(daemon.next_tick(1020.0, 30), 1050.0)
+        # boundaries don't depend on when the previous cycle has finished
+        self.assertEqual(daemon.next_tick(1049.9, 30), 1050.0)
+
+    def test_overrun_is_skipped(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        release, started = threading.Event(), threading.Event()
+        def collect():
+            started.set()
+            release.wait(5)
+            daemon.stats.add(0.5)
+            return 0.0, []
+
+        loop = asyncio.new_event_loop()
+        saved = daemon.collect, daemon.executor, daemon.stats, daemon.collecting
+        daemon.collect, daemon.executor = collect, ThreadPoolExecutor(max_workers=1)
+        daemon.stats = daemon.CycleStats(30)
+        try:
+            lc = (loop, lambda lc: None)
+            daemon.zag_sampler_loop(lc)
+            started.wait(5)
+            # the first cycle is still running in the executor
+            daemon.zag_sampler_loop(lc)
+            release.set()
+            loop.run_until_complete(daemon.collecting)
+            self.assertEqual(daemon.stats.cycles, 1)
+            self.assertEqual(daemon.stats.skipped, 1)
+            self.assertEqual(daemon.stats.as_dict()["budget"], 0.5 / 30)
+        finally:
+            daemon.executor.shutdown()
+            daemon.collect, daemon.executor, daemon.stats, daemon.collecting = saved
+            loop.close()
+
+    def test_failed_cycle_rebuilds_table(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        class Table:
+            def update(self):
+                raise IndexError("cycle failed halfway")
+
+        saved = daemon.proctable
+        daemon.proctable = Table()
+        try:
+            self.assertRaises(IndexError, daemon.collect)
+            # half-updated table is not reused by the next cycle
+            self.assertIsNone(daemon.proctable)
+        finally:
+            daemon.proctable = saved
+
+    def test_store_without_snapshot(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        class Sqlite:
+            def __init__(self): self.stored = []
+            def add_records(self, ts, rows): self.stored.append((ts, rows))
+        class Sender:
+            server = "zabbix"
+            def send(self, ts, names, bundles): raise OSError("queue is broken")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            future = Future()
+            future.set_result((1000.0, [ ("nginx", 1, 2, 3, 4, 5.0) ]))
+            saved = daemon.sqlite, daemon.sender, daemon.SNAPPATH, daemon.latest, daemon.stats
+            daemon.sqlite, daemon.sender = Sqlite(), Sender()
+            daemon.latest, daemon.stats = daemon.LatestValues(), daemon.CycleStats(30)
+            daemon.stats.add(0.5)
+            # snapshot directory is missing
+            daemon.SNAPPATH = os.path.join(tmp, "missing", "latest.snap")
+            try:
+                with self.assertLogs(level="ERROR") as logs:
+                    daemon.store(future)
+                self.assertEqual(len(logs.records), 2)
+                self.assertEqual(daemon.sqlite.stored, [ future.result() ])
+            finally:
+                daemon.sqlite, daemon.sender, daemon.SNAPPATH, daemon.latest, daemon.stats = saved
+
+    def test_store_without_sqlite(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        class Sqlite:
+            DBPATH = "zaggregator.db"
+            def add_records(self, ts, rows): raise sqlite3.OperationalError("database is locked")
+        class Sender:
+            server = "zabbix"
+            def __init__(self): self.sent = []
+            def send(self, ts, names, bundles): self.sent.append((ts, names))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            future = Future()
+            future.set_result((time.time(), [ ("nginx", 1, 2, 3, 4, 5.0) ]))
+            saved = daemon.sqlite, daemon.sender, daemon.SNAPPATH, daemon.latest, daemon.stats
+            daemon.sqlite, daemon.sender = Sqlite(), Sender()
+            daemon.latest, daemon.stats = daemon.LatestValues(), daemon.CycleStats(30)
+            daemon.stats.add(0.5)
+            daemon.SNAPPATH = os.path.join(tmp, "latest.snap")
+            try:
+                with self.assertLogs(level="ERROR") as logs:
+                    daemon.store(future)
+                self.assertEqual(len(logs.records), 1)
+                self.assertEqual(snapfile.open_snapshot(daemon.SNAPPATH).get("nginx", "rss"), 1)
+                self.assertEqual(daemon.sender.sent, [ (future.result()[0], ["nginx"]) ])
+            finally:
+                daemon.sqlite, daemon.sender, daemon.SNAPPATH, daemon.latest, daemon.stats = saved
+
+
+if __name__ == '__main__':
+    tests.run_test_module_by_name(__file__)
@@ -0,0 +1,41 @@
+import unittest
+import inspect
+import logging
+
+import zaggregator.tests as tests
+from zaggregator.pcpu import CpuSampler
+from zaggregator.procscan import ProcRecord
+
+
+def record(pid, start, cpu_time):
+    return ProcRecord(pid, 1, pid, "test", [], 0, 0, 0, 0, start, cpu_time)
+
+class TestCpuSampler(tests.TestCase):
+
+    def test_first_sample_since_start(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        sampler = CpuSampler()
+        pcpu = sampler.sample([ record(10, 90.0, 5.0), record(11, 100.0, 0.0) ],
+                cpu_total=100.0, uptime=100.0)
+        self.assertEqual(pcpu, { 10: 50.0, 11: 0.0 })
+
+    def test_delta_between_cycles(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        sampler = CpuSampler()
+        sampler.sample([ record(10, 50.0, 5.0) ], cpu_total=100.0, uptime=100.0)
+        pcpu = sampler.sample([ record(10, 50.0, 20.0) ], cpu_total=130.0,
+                uptime=130.0)
+        self.assertEqual(pcpu[10], 50.0)
+
+    def test_pid_reuse(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        sampler = CpuSampler()
+        sampler.sample([ record(10, 50.0, 40.0) ], cpu_total=100.0, uptime=100.0)
+        # same pid, but another process started at 120s
+        pcpu = sampler.sample([ record(10, 120.0, 5.0) ], cpu_total=130.0,
+                uptime=130.0)
+        self.assertEqual(pcpu[10], 50.0)
+
+
+if __name__ == '__main__':
+    tests.run_test_module_by_name(__file__)
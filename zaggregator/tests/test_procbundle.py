@@ -133,5 +133,30 @@ class TestProcBundle(tests.TestCase):
         """
     """
 
+    def test_name_from_cmdargs_cache(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+
+        def mirror(pid, pgid, cmdline):
+            return ProcessMirror(tests.record(pid, 1, pgid, cmdline), None)
+
+        pb.name_from_cmdline.cache_clear()
+        workers = [ mirror(pid, 100, ["/usr/bin/python3", "-u", "/opt/app/worker.py"])
+                for pid in range(100, 110) ]
+        names = [ ProcBundle.name_from_cmdargs(m) for m in workers ]
+        self.assertEqual(names[0], "/opt/app/worker.py")
+        self.assertEqual(pb.name_from_cmdline.cache_info().misses, 1)
+        self.assertEqual(pb.name_from_cmdline.cache_info().hits, 9)
+        self.assertEqual(ProcBundle.name_from_cmdargs(
+            mirror(200, 200, ["postgres: writer process", "", ""])), "postgres")
+        self.assertEqual(ProcBundle.name_from_cmdargs(mirror(2, 0, [])), "kernel")
+        # zombie alone in its process group has no command line
+        self.assertEqual(pb.name_from_cmdline(()), "defunct")
+
+        # equal names of different command lines are the same object
+        other = ProcBundle.name_from_cmdargs(mirror(300, 300, ["python3", "/opt/app/worker.py"]))
+        self.assertEqual(other, "/opt/app/worker.py")
+        self.assertTrue(other is names[0])
+        self.assertTrue(workers[0]._name is workers[1]._name)
+
 if __name__ == '__main__':
     run_test_module_by_name(__file__)
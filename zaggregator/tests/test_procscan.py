@@ -0,0 +1,82 @@
+import unittest
+import psutil
+import os, sys
+import shutil
+import subprocess
+import tempfile
+import time
+import inspect
+import logging
+
+import zaggregator.procscan as procscan
+import zaggregator.tests as tests
+from zaggregator.procscan import ProcRecord, LinuxScanner, PsutilScanner
+
+
+class TestProcScan(tests.TestCase):
+
+    def test_parse_cmdline(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        self.assertEqual(procscan.parse_cmdline(""), [])
+        self.assertEqual(procscan.parse_cmdline("/bin/sh\x00-c\x00true\x00"),
+                ["/bin/sh", "-c", "true"])
+        self.assertEqual(procscan.parse_cmdline("zaggregator: master"),
+                ["zaggregator:", "master"])
+        self.assertEqual(procscan.parse_cmdline("postgres: writer\x00\x00\x00"),
+                ["postgres: writer", "", ""])
+
+    def test_PsutilScanner_scan(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        records = PsutilScanner().scan()
+        self.assertTrue(len(records) > 0)
+        self.assertIsInstance(records[0], ProcRecord)
+        self.assertIn(os.getpid(), [ r.pid for r in records ])
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "Linux only")
+    def test_LinuxScanner_matches_psutil(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        proc = psutil.Process(pid=os.getpid())
+        record = LinuxScanner().read(os.getpid())
+        reference = PsutilScanner.record(proc)
+        self.assertEqual(record.pid, reference.pid)
+        self.assertEqual(record.ppid, reference.ppid)
+        self.assertEqual(record.pgid, reference.pgid)
+        self.assertEqual(record.name, reference.name)
+        self.assertEqual(record.cmdline, reference.cmdline)
+        self.assertTrue(record.vms > 0 and record.rss > 0)
+        self.assertTrue(record.ctx_vol <= proc.num_ctx_switches().voluntary)
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "Linux only")
+    def test_LinuxScanner_long_name(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "unittest-long-process-name")
+        os.symlink(shutil.which("sleep"), path)
+        child = subprocess.Popen([path, "5"])
+        try:
+            time.sleep(0.1)
+            record = LinuxScanner().read(child.pid)
+            reference = PsutilScanner.record(psutil.Process(child.pid))
+            self.assertEqual(record.name, "unittest-long-process-name")
+            self.assertEqual(record.name, reference.name)
+        finally:
+            child.kill()
+            child.wait()
+            shutil.rmtree(tmpdir)
+
+    def test_PsutilScanner_record_gone(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        child = subprocess.Popen(["true"])
+        proc = psutil.Process(child.pid)
+        child.wait()
+        record = PsutilScanner.record(proc)
+        self.assertEqual((record.pid, record.rss, record.cmdline), (child.pid, 0, []))
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "Linux only")
+    def test_LinuxScanner_gone(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        self.assertIsNone(LinuxScanner().read(2**30))
+
+
+if __name__ == '__main__':
+    tests.run_test_module_by_name(__file__)
@@ -15,6 +15,7 @@ from zaggregator.procbundle import ProcBundle
 from zaggregator.proctable import ProcTable
 from zaggregator.procmirror import ProcessMirror
 from zaggregator.tests import cycle
+from zaggregator.tests.synthetic import synthetic_cycles
 import zaggregator.config
 
 zaggregator.config.DEFAULT_INTERVAL=0.1
@@ -37,6 +38,152 @@ class TestProcMirror(tests.TestCase):
         mirror.set_pcpu(0.123456)
         self.assertTrue(mirror.pcpu == 0.123456)
 
+def bundles_summary(pt):
+    return sorted((b.bundle_name, sorted(p.pid for p in b.proclist), b.rss)
+            for b in pt.bundles)
+
+class TestProcTableUpdate(tests.TestCase):
+
+    cycle1 = [
+        tests.record(1, 0, 1, ["/sbin/init"]),
+        tests.record(10, 1, 10, ["nginx: master", "", ""]),
+        tests.record(11, 10, 10, ["nginx: worker", "", ""]),
+        tests.record(12, 10, 10, ["nginx: worker", "", ""]),
+        tests.record(20, 1, 20, ["/usr/sbin/cron", "-f"]),
+        tests.record(30, 1, 30, ["/bin/bash"]),
+        tests.record(31, 30, 30, ["sleep", "100"]),
+        ]
+    cycle2 = [ r for r in cycle1 if r.pid not in (12, 31) ] + [
+        tests.record(13, 10, 10, ["nginx: worker", "", ""]),
+        tests.record(32, 30, 30, ["/usr/bin/python3", "job.py"]),
+        ]
+
+    def test_update_matches_full_build(self):
+        scanner = tests.StaticScanner(self.cycle1, self.cycle2)
+        pt = ProcTable(scanner=scanner)
+        pt.update()
+        fresh = ProcTable(scanner=tests.StaticScanner(self.cycle2))
+        self.assertEqual(bundles_summary(pt), bundles_summary(fresh))
+
+    def test_update_reuses_survivors(self):
+        scanner = tests.StaticScanner(self.cycle1, self.cycle2)
+        pt = ProcTable(scanner=scanner)
+        master = pt.mirror_by_pid(10)
+        pt.update()
+        self.assertTrue(pt.mirror_by_pid(10) is master)
+        self.assertIsNone(pt.mirror_by_pid(12))
+        # only new processes got their cmdline read
+        self.assertEqual(scanner.cmdline_reads, len(self.cycle1) + 2)
+
+    def test_update_exec(self):
+        cycle2 = [ r for r in self.cycle1 if r.pid != 31 ] + [
+            tests.record(31, 30, 30, ["/usr/bin/vim"]) ]
+        pt = ProcTable(scanner=tests.StaticScanner(self.cycle1, cycle2))
+        sleep = pt.mirror_by_pid(31)
+        pt.update()
+        self.assertFalse(pt.mirror_by_pid(31) is sleep)
+        self.assertEqual(pt.mirror_by_pid(31).cmdline(), ["/usr/bin/vim"])
+
+    def test_bundle_of(self):
+        pt = ProcTable(scanner=tests.StaticScanner(self.cycle1, self.cycle2))
+        nginx = pt.get_bundle_by_name("nginx")
+        self.assertTrue(pt.bundle_of(11) is nginx)
+        self.assertTrue(pt.is_bundled(pt.mirror_by_pid(11)))
+        self.assertEqual(set(p.pid for p in pt.bundled()),
+                set(p.pid for p in pt._procs))
+        pt.update()
+        self.assertIsNone(pt.bundle_of(12))
+        self.assertTrue(pt.bundle_of(13) is nginx)
+
+    def test_merge_by_name(self):
+        shells = [ tests.record(pid, 1, pid, ["/bin/bash"]) for pid in (40, 50, 60) ]
+        pt = ProcTable(scanner=tests.StaticScanner(self.cycle1 + shells,
+            self.cycle1 + shells[:1]))
+        bash = pt.get_bundle_by_name("bash")
+        self.assertEqual(pt.get_bundle_names().count("bash"), 1)
+        self.assertEqual(len([ b for b in pt.bundles if b.bundle_name == "bash" ]), 1)
+        self.assertEqual(sorted(bash._pids), [30, 31, 40, 50, 60])
+        pt.update()
+        self.assertTrue(pt.get_bundle_by_name("bash") is bash)
+        self.assertIsNone(pt.get_bundle_by_name("nonexistent"))
+
+    def test_update_pcpu(self):
+        cycle2 = [ r._replace(cpu_time=16.0) if r.pid == 10 else r
+                for r in self.cycle1 ]
+        pt = ProcTable(scanner=tests.StaticScanner(self.cycle1, cycle2))
+        pt.update()
+        self.assertEqual(pt.mirror_by_pid(10).pcpu, 50.0)
+        self.assertEqual(pt.mirror_by_pid(11).pcpu, 0.0)
+
+    def test_update_stats(self):
+        cycle2 = [ r._replace(rss=8192) if r.pid == 11 else r for r in self.cycle2 ]
+        pt = ProcTable(scanner=tests.StaticScanner(self.cycle1, cycle2))
+        pt.update()
+        nginx = pt.get_bundle_by_name("nginx")
+        self.assertEqual((nginx.nprocs, nginx.rss, nginx.rss_max), (3, 10240, 8192))
+        self.assertEqual(nginx.pcpu, sum(p.pcpu for p in nginx.proclist))
+
+    def test_unregistered_stats(self):
+        pt = ProcTable(scanner=tests.StaticScanner(self.cycle1))
+        # stats of bundles built outside the table are calculated on demand
+        bundle = ProcBundle(pt.mirror_by_pid(10), pt=pt)
+        self.assertEqual(bundle.rss, sum(p.rss for p in bundle.proclist))
+        self.assertEqual(bundle.get_memory_info_vms(), sum(p.vms for p in bundle.proclist))
+        self.assertEqual(bundle.nprocs, len(bundle.proclist))
+        with self.assertRaises(AttributeError):
+            bundle.nonexistent
+
+    def test_update_synthetic(self):
+        cycles = synthetic_cycles(2000, 3, churn=0.1)
+        pt = ProcTable(scanner=tests.StaticScanner(*cycles))
+        for records in cycles:
+            # every process is bundled, pgid groups may overlap with
+            # subtrees walked by the bundles registered before them
+            self.assertEqual(set(p.pid for p in pt.bundled()), set(r.pid for r in records))
+            self.assertEqual(len(set(pt.get_bundle_names())), len(pt.bundles))
+            if records is not cycles[-1]:
+                pt.update()
+        # survivors keep their bundles, so membership may differ from a
+        # full build, which depends on the order pgid groups are bundled in
+        fresh = ProcTable(scanner=tests.StaticScanner(cycles[-1]))
+        self.assertEqual(sorted(pt.get_bundle_names()), sorted(fresh.get_bundle_names()))
+
+class TestProcTableTop(tests.TestCase):
+
+    daemons = [ tests.record(pid, 1, pid, ["/usr/sbin/daemon{}".format(pid)],
+        rss=(pid * 37) % 101 * 1024, cpu_time=(pid * 13) % 17)
+        for pid in range(100, 140) ]
+
+    def test_get_top(self):
+        pt = ProcTable(scanner=tests.StaticScanner(self.daemons))
+        expected = []
+        for m in zaggregator.config.metrics:
+            for b in sorted(pt.bundles, key=lambda b: getattr(b, m), reverse=True)[:3]:
+                if b not in expected:
+                    expected.append(b)
+        self.assertEqual(pt.get_top(3), expected)
+        self.assertEqual(pt.get_top(3, metrics=("rss",)),
+                sorted(pt.bundles, key=lambda b: b.rss, reverse=True)[:3])
+        self.assertEqual(len(pt.get_top(100, metrics=("rss",))), len(pt.bundles))
+
+    def test_get_top_other(self):
+        pt = ProcTable(scanner=tests.StaticScanner(self.daemons))
+        top = pt.get_top(2, other=True)
+        other = top[-1]
+        self.assertEqual(other.bundle_name, pb.OTHER_NAME)
+        self.assertEqual(len(other.bundles) + len(top) - 1, len(pt.bundles))
+        for m in zaggregator.config.metrics:
+            self.assertAlmostEqual(sum(getattr(b, m) for b in top),
+                    sum(getattr(b, m) for b in pt.bundles))
+        self.assertIsInstance(other.pcpu, float)
+
+        # a real bundle called "other" is stored apart from the rest
+        records = self.daemons + [ tests.record(200, 1, 200, ["/usr/bin/other"], rss=2**30) ]
+        pt = ProcTable(scanner=tests.StaticScanner(records))
+        names = [ b.bundle_name for b in pt.get_top(2, other=True) ]
+        self.assertIn("other", names)
+        self.assertEqual(len(set(names)), len(names))
+
 class TestProcTable(tests.TestCase):
     def test_ProcTable_mirror_by_pid(self):
         pt = ProcTable()
@@ -83,6 +230,34 @@ class TestProcTable(tests.TestCase):
 
         bunch.stop()
 
+    def test_ProcTable_descendants(self):
+        bname = 'unittest-ptd'
+        bunch, myproc, psutilproc = tests.BunchProto.start(bname, nchildren=3)
+        pt = ProcTable()
+        self.assertEqual(sorted(pt.descendants(psutilproc.pid)),
+                sorted([ p.pid for p in psutilproc.children(recursive=True) ]))
+        self.assertEqual(pt.descendants(2**30), [])
+
+        bunch.stop()
+
+    def test_ProcTable_no_psutil_children(self):
+        bname = 'unittest-ptnc'
+        bunch, myproc, psutilproc = tests.BunchProto.start(bname, nchildren=3)
+
+        def forbidden(*args, **kwargs):
+            raise AssertionError("psutil.Process.children() called")
+        children = psutil.Process.children
+        psutil.Process.children = forbidden
+        try:
+            pt = ProcTable()
+            m = pt.mirror_by_pid(psutilproc.pid)
+            self.assertEqual(len(m.children()), 3)
+            self.assertTrue(m.children()[0].parent() is m)
+        finally:
+            psutil.Process.children = children
+
+        bunch.stop()
+
     def test_ProcTable_test(self):
         bname = 'unittest-t'
         nchildren = 5
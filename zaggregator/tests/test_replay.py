@@ -0,0 +1,98 @@
+import unittest
+import gzip
+import inspect
+import json
+import logging
+import os
+import tempfile
+
+import zaggregator.tests as tests
+import zaggregator.sqlite as sqlite
+from zaggregator import replay
+from zaggregator.proctable import ProcTable, top_rows
+from zaggregator.tests.synthetic import synthetic_cycles
+
+
+class TestReplay(tests.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "host.replay.gz")
+        self.db = sqlite.db
+
+    def tearDown(self):
+        if sqlite.db is not self.db:
+            sqlite.db.close()
+            sqlite.db = self.db
+        self.tmp.cleanup()
+
+    def record(self, cycles):
+        """ Record cycles through ProcTable, returns their summaries """
+        scanner = tests.StaticScanner(*cycles)
+        recorder = replay.Recorder(self.path, scanner)
+        pt = ProcTable(scanner=recorder)
+        summaries = [ replay.summary(pt) ]
+        for n in range(1, len(cycles)):
+            pt.update()
+            summaries.append(replay.summary(pt))
+        recorder.close()
+        return summaries, pt, scanner
+
+    def test_record_replay(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        cycles = synthetic_cycles(1000, 3, churn=0.1)
+        recorded, pt, scanner = self.record(cycles)
+        # the recorder doesn't read more command lines than ProcTable would
+        direct = tests.StaticScanner(*cycles)
+        direct_pt = ProcTable(scanner=direct)
+        direct_pt.update()
+        direct_pt.update()
+        self.assertEqual(replay.summary(direct_pt), recorded[-1])
+        self.assertEqual(scanner.cmdline_reads, direct.cmdline_reads)
+
+        # survivors are recorded without their command lines
+        with gzip.open(self.path, "rt") as fd:
+            lines = [ json.loads(line) for line in fd ]
+        self.assertEqual(lines[0]["magic"], replay.MAGIC)
+        self.assertEqual(len(lines), 4)
+        self.assertFalse(any(r[4] is None for r in lines[1]["records"]))
+        self.assertTrue(sum(r[4] is None for r in lines[2]["records"]) > 800)
+
+        summaries, elapsed = replay.replay(self.path, ":memory:")
+        self.assertEqual(summaries, recorded)
+        self.assertEqual(len(elapsed), 3)
+        self.assertEqual(replay.compare(summaries, recorded), [])
+        # latest values are the top bundles of the last cycle
+        for name, rss, vms, ctxvol, ctxinvol, pcpu in top_rows(pt):
+            self.assertEqual(sqlite.get(name, "rss"), rss)
+            self.assertAlmostEqual(sqlite.get(name, "pcpu"), pcpu)
+
+        scanner = replay.ReplayScanner(self.path)
+        self.assertEqual([ r.cmdline for r in scanner.cycles[2].records ],
+                [ r.cmdline for r in cycles[2] ])
+        for n in range(3):
+            scanner.scan()
+        with self.assertRaises(EOFError):
+            scanner.scan()
+
+    def test_compare(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        recorded, pt, scanner = self.record(synthetic_cycles(200, 2))
+        changed = json.loads(json.dumps(recorded))
+        name = sorted(changed[1])[0]
+        changed[1][name][1] += 1024
+        changed[1]["renamed"] = changed[1].pop(sorted(changed[1])[-1])
+        diffs = replay.compare(recorded, changed)
+        self.assertEqual(len(diffs), 3)
+        self.assertTrue(diffs[0].startswith("cycle 1: bundle"))
+        self.assertEqual(replay.compare(recorded[:1], changed)[0], "1 cycles, 2 in baseline")
+
+    def test_bad_file(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        with gzip.open(self.path, "wt") as fd:
+            fd.write(json.dumps({ "magic": "other", "version": 1 }) + "\n")
+        with self.assertRaises(replay.BadReplay):
+            replay.ReplayScanner(self.path)
+
+if __name__ == '__main__':
+    tests.run_test_module_by_name(__file__)
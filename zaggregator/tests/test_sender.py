@@ -0,0 +1,159 @@
+import unittest
+import asyncio
+import inspect
+import json
+import logging
+import os
+import struct
+import xml.etree.ElementTree as ElementTree
+
+import zaggregator.tests as tests
+from zaggregator import sender as zsender
+from zaggregator.sender import ZabbixSender
+from zaggregator.config import metrics
+
+TEMPLATES = os.path.join(os.path.dirname(__file__), "..", "..", "misc")
+
+
+class FakeTrapper:
+    """
+        Zabbix trapper answering "success" to each request, keeps
+        connections open unless `close_after' is set like Zabbix server
+    """
+    def __init__(self, close_after=False):
+        self.close_after = close_after
+        self.requests = []
+        self.connections = 0
+        self.server = None
+
+    async def start(self, port=0):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                length = zsender.decode_header(await reader.readexactly(zsender.HEADER_LEN))
+                request = json.loads((await reader.readexactly(length)).decode())
+                self.requests.append(request)
+                writer.write(zsender.encode({ "response": "success",
+                    "info": "processed: {}; failed: 0".format(len(request["data"])) }))
+                await writer.drain()
+                if self.close_after:
+                    break
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+
+async def wait_sent(sender, n):
+    for i in range(200):
+        if sender.sent >= n:
+            return
+        await asyncio.sleep(0.01)
+
+BUNDLES = { "nginx": { "rss": 10, "pcpu": 1.5 }, "my, bundle": { "rss": 11, "pcpu": 0.0 } }
+
+class TestSender(tests.TestCase):
+
+    def run_async(self, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_protocol(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        packet = zsender.encode({ "request": "sender data" })
+        self.assertEqual(packet[:5], b"ZBXD\x01")
+        self.assertEqual(struct.unpack("<Q", packet[5:13])[0], len(packet) - 13)
+        self.assertEqual(zsender.decode_header(packet[:13]), len(packet) - 13)
+        with self.assertRaises(zsender.ProtocolError):
+            zsender.decode_header(b"HTTP/1.1 400")
+        self.assertEqual(zsender.item_key("nginx", "rss"), "ps.procstat[nginx, rss]")
+        self.assertEqual(zsender.item_key("my, bundle", "rss"), 'ps.procstat["my, bundle", rss]')
+
+        request = zsender.sender_data("host1", ["my, bundle", "nginx"], 1000, BUNDLES)
+        self.assertEqual(len(request["data"]), 5)
+        self.assertEqual(request["data"][0]["key"], "ps.discovery")
+        self.assertEqual(len(json.loads(request["data"][0]["value"])["data"]), 3)
+        self.assertIn({ "host": "host1", "key": "ps.procstat[nginx, pcpu]",
+            "value": "1.5", "clock": 1000 }, request["data"])
+
+    def test_template_keys(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        request = zsender.sender_data("host1", ["nginx"], 1000,
+                { "nginx": { m: 1 for m in metrics } })
+        keys = set(d["key"] for d in request["data"])
+        for fname, itype in (("zbx_export_templates.xml", "0"),
+                ("zbx_export_templates_trapper.xml", "2")):
+            rule = ElementTree.parse(os.path.join(TEMPLATES, fname)).find(".//discovery_rule")
+            self.assertEqual(rule.findtext("type"), itype)
+            self.assertIn(rule.findtext("key"), keys)
+            prototypes = rule.findall(".//item_prototype")
+            self.assertTrue(prototypes)
+            defined = { rule.findtext("key") }
+            for item in prototypes:
+                self.assertEqual(item.findtext("type"), itype)
+                # Zabbix accepts pushed values only for the exact item key
+                defined.add(item.findtext("key").replace("{#PROCGROUP}", "nginx"))
+            self.assertTrue(defined <= keys)
+        # and rejects values pushed for keys the template doesn't define
+        self.assertEqual(defined, keys)
+
+    def test_send(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        async def run(trapper):
+            sender = ZabbixSender("127.0.0.1", await trapper.start(), "host1")
+            sender.send(1000, ["nginx"], BUNDLES)
+            sender.send(1030, ["nginx"], BUNDLES)
+            await wait_sent(sender, 2)
+            await sender.close()
+            await trapper.stop()
+            return sender
+
+        trapper = FakeTrapper()
+        sender = self.run_async(run(trapper))
+        self.assertEqual(sender.sent, 2)
+        self.assertEqual([ r["clock"] for r in trapper.requests ], [1000, 1030])
+        # both cycles went over the same connection
+        self.assertEqual(trapper.connections, 1)
+
+        trapper = FakeTrapper(close_after=True)
+        sender = self.run_async(run(trapper))
+        self.assertEqual(sender.sent, 2)
+        self.assertEqual(trapper.connections, 2)
+
+    def test_unavailable(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        async def run(trapper):
+            port = await trapper.start()
+            await trapper.stop()
+            sender = ZabbixSender("127.0.0.1", port, "host1", queue_max=2,
+                    retry_min=0.01, retry_max=0.05)
+            for ts in (1000, 1030, 1060):
+                sender.send(ts, ["nginx"], BUNDLES)
+                await asyncio.sleep(0.05)
+            self.assertEqual(len(sender.queue), 2)
+            self.assertEqual(sender.dropped, 1)
+            self.assertEqual(sender.sent, 0)
+            # queued cycles are sent once the trapper is back
+            await trapper.start(port)
+            await wait_sent(sender, 2)
+            await sender.close()
+            await trapper.stop()
+            return sender
+
+        trapper = FakeTrapper()
+        sender = self.run_async(run(trapper))
+        self.assertEqual([ r["clock"] for r in trapper.requests ], [1030, 1060])
+        self.assertEqual(sender.backoff, sender.retry_min)
+
+
+if __name__ == '__main__':
+    tests.run_test_module_by_name(__file__)
@@ -0,0 +1,109 @@
+import unittest
+import asyncio
+import inspect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import zaggregator.tests as tests
+from zaggregator import client
+from zaggregator.server import LatestValues, QueryServer
+from zaggregator.config import sock_line_max
+
+
+class TestQueryServer(tests.TestCase):
+
+    def latest(self):
+        latest = LatestValues()
+        now = time.time()
+        latest.update(now - 600, [ ("cron", 1, 2, 3, 4, 5.0) ])
+        latest.update(now, [ ("nginx", 10, 20, 30, 40, 50.0),
+            ("my bundle", 11, 21, 31, 41, 51.0) ])
+        return latest
+
+    def test_latest(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        latest = self.latest()
+        self.assertEqual(latest.names(), ["cron", "my bundle", "nginx"])
+        self.assertEqual(latest.get("nginx", "ctx_vol"), 30)
+        self.assertEqual(latest.get("nginx", "ctxinvol"), 40)
+        self.assertIsNone(latest.get("cron", "rss"))
+        self.assertIsNone(latest.get("nonexistent", "rss"))
+        latest.prune(300)
+        self.assertEqual(latest.names(), ["my bundle", "nginx"])
+
+    def test_query(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        server = QueryServer(self.latest())
+        discovery = json.loads(server.query("discover\n"))
+        self.assertIn({ "{#PROCGROUP}": "nginx" }, discovery["data"])
+        self.assertEqual(json.loads(server.query("get nginx pcpu")), 50.0)
+        self.assertEqual(json.loads(server.query("get my bundle rss")), 11)
+        self.assertIsNone(json.loads(server.query("get cron rss")))
+        self.assertEqual(json.loads(server.query("stats")), {})
+        self.assertIn("error", json.loads(server.query("get nginx")))
+        self.assertIn("error", json.loads(server.query("get nginx nometric")))
+        self.assertIn("error", json.loads(server.query("unknown")))
+
+    def test_all(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        server = QueryServer(self.latest())
+        document = json.loads(server.query("all"))
+        self.assertEqual(len(document["data"]), 4)
+        self.assertEqual(set(document["bundles"]), {"nginx", "my bundle"})
+        self.assertEqual(document["bundles"]["nginx"], { "rss": 10, "vms": 20,
+            "ctx_vol": 30, "ctx_invol": 40, "pcpu": 50.0 })
+        self.assertTrue(abs(document["ts"] - time.time()) < 5)
+        empty = json.loads(QueryServer(LatestValues()).query("all"))
+        self.assertEqual((empty["ts"], empty["bundles"]), (None, {}))
+
+    def test_socket(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "zaggregator.sock")
+            self.assertIsNone(client.query("discover", path))
+
+            loop = asyncio.new_event_loop()
+            server = QueryServer(self.latest())
+            loop.run_until_complete(server.start(path))
+            thread = threading.Thread(target=loop.run_forever)
+            thread.start()
+            try:
+                self.assertEqual(json.loads(client.query("get nginx rss", path)), 10)
+                self.assertEqual(client.query("discover", path), server.query("discover"))
+            finally:
+                loop.call_soon_threadsafe(loop.stop)
+                thread.join()
+                server.close()
+                loop.run_until_complete(server.server.wait_closed())
+                loop.close()
+            self.assertFalse(os.path.exists(path))
+
+    def test_line_max(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        class Transport:
+            closed = False
+            def __init__(self): self.written = []
+            def write(self, data): self.written.append(data)
+            def close(self): self.closed = True
+            def is_closing(self): return self.closed
+
+        protocol = QueryServer(self.latest()).protocol()
+        protocol.connection_made(Transport())
+        protocol.data_received(b"get nginx rss\nget nginx")
+        self.assertEqual(protocol.transport.written, [ b"10\n" ])
+        self.assertFalse(protocol.transport.closed)
+        protocol.data_received(b" rss\n\xff\xfe rss\n")
+        self.assertIn("error", json.loads(protocol.transport.written[-1].decode()))
+        self.assertFalse(protocol.transport.closed)
+        for _ in range(sock_line_max // 1024 + 1):
+            protocol.data_received(b"x" * 1024)
+        self.assertTrue(protocol.transport.closed)
+        self.assertEqual(protocol.buffer, b"")
+
+
+if __name__ == '__main__':
+    tests.run_test_module_by_name(__file__)
@@ -0,0 +1,103 @@
+import unittest
+import contextlib
+import inspect
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+
+import zaggregator.tests as tests
+from zaggregator import snapfile, client
+
+
+class TestSnapfile(tests.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "latest.snap")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def bundles(self, now):
+        bundles = { "bundle{:03d}".format(i): (now, (i, 2 * i, 3 * i, 4 * i, i / 10))
+                for i in range(100) }
+        bundles["nginx: worker"] = (now, (10, 20, 30, 40, 50.0))
+        bundles["процесс"] = (now, (11, 21, 31, 41, 51.0))
+        bundles["cron"] = (now - 600, (1, 2, 3, 4, 5.0))
+        return bundles
+
+    def test_lookup(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        now = time.time()
+        bundles = self.bundles(now)
+        snapfile.write(self.path, now, bundles)
+        snapshot = snapfile.open_snapshot(self.path)
+        self.assertEqual(snapshot.ts, int(now))
+        self.assertEqual(sorted(snapshot.names()), sorted(bundles))
+        for name, (ts, (rss, vms, ctxvol, ctxinvol, pcpu)) in bundles.items():
+            if name == "cron":
+                continue
+            self.assertEqual(snapshot.get(name, "rss"), rss)
+            self.assertEqual(snapshot.get(name, "ctx_vol"), ctxvol)
+            self.assertEqual(snapshot.get(name, "ctxinvol"), ctxinvol)
+            self.assertEqual(snapshot.get(name, "pcpu"), pcpu)
+        # stale and unknown bundles
+        self.assertIsNone(snapshot.get("cron", "rss"))
+        for name in ("", "a", "bundle", "bundle0999", "zzz"):
+            self.assertIsNone(snapshot.get(name, "rss"))
+        with self.assertRaises(KeyError):
+            snapshot.get("nginx: worker", "nometric")
+        snapshot.close()
+
+    def test_replace(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        self.assertIsNone(snapfile.open_snapshot(self.path))
+        now = time.time()
+        snapfile.write(self.path, now, self.bundles(now))
+        old = snapfile.open_snapshot(self.path)
+        snapfile.write(self.path, now, { "nginx: worker": (now, (1, 1, 1, 1, 1.0)) })
+        # readers keep the snapshot they have opened
+        self.assertEqual(old.get("nginx: worker", "rss"), 10)
+        self.assertEqual(snapfile.open_snapshot(self.path).get("nginx: worker", "rss"), 1)
+        self.assertEqual(os.listdir(self.tmp.name), ["latest.snap"])
+        old.close()
+
+        snapfile.write(self.path, now - 600, self.bundles(now))
+        self.assertIsNone(snapfile.open_snapshot(self.path))
+        for data in (b"", b"ZAGS", b"ZAGX" + bytes(100)):
+            with open(self.path, "wb") as fd:
+                fd.write(data)
+            self.assertIsNone(snapfile.open_snapshot(self.path))
+
+    def test_client(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        now = time.time()
+        snapfile.write(self.path, now, self.bundles(now))
+        saved = client.SNAPPATH
+        client.SNAPPATH = self.path
+        try:
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                client.check(("nginx: worker", "rss"))
+                client.check(("cron", "rss"))
+            self.assertEqual(out.getvalue(), "10\nNone\n")
+
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                client.all_bundles()
+            document = json.loads(out.getvalue())
+            self.assertEqual(document["ts"], int(now))
+            self.assertEqual(len(document["data"]), 104)
+            # cron isn't updated by the last cycle
+            self.assertEqual(len(document["bundles"]), 102)
+            self.assertEqual(document["bundles"]["nginx: worker"],
+                    { "pcpu": 50.0, "rss": 10, "vms": 20, "ctx_vol": 30, "ctx_invol": 40 })
+        finally:
+            client.SNAPPATH = saved
+
+
+if __name__ == '__main__':
+    tests.run_test_module_by_name(__file__)
@@ -2,11 +2,16 @@ import unittest
 import logging
 import inspect
 import sqlite3
+import time
+import os
+import tempfile
+import multiprocessing
 
 import zaggregator.sqlite as sqlite
 sqlite.DBPATH = ":memory:"
 sqlite.__init__(sqlite.DBPATH)
 import zaggregator.tests as tests
+from zaggregator.config import sample_interval
 
 
 class TestSqliteModule(tests.TestCase):
@@ -31,5 +36,170 @@ class TestSqliteModule(tests.TestCase):
         self.assertTrue(names == [ r[0] for r in self.records ])
 
 
+class TestSqliteAddRecords(tests.TestCase):
+
+    def setUp(self):
+        self.db = sqlite.db
+        sqlite.__init__(":memory:")
+
+    def tearDown(self):
+        sqlite.db.close()
+        sqlite.db = self.db
+
+    def test_add_records(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        rows = [ ("it's", 1, 2, 3, 4, 5.0), ('say "hi"', 6, 7, 8, 9, 10.0) ]
+        sqlite.add_records(time.time(), rows)
+        self.assertEqual(sqlite.get("it's", "rss"), 1)
+        self.assertEqual(sqlite.get('say "hi"', "ctx_invol"), 9)
+        stamps = sqlite.db.execute("SELECT DISTINCT(ts) FROM samples").fetchall()
+        self.assertEqual(len(stamps), 1)
+        self.assertEqual(sqlite.db.execute("SELECT COUNT(*) FROM bundles").fetchone()[0], 2)
+
+    def test_add_records_bad(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        count = lambda: sqlite.db.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+        before = count()
+        with self.assertRaises(sqlite.BadRecord):
+            sqlite.add_records(time.time(), [ ("good", 1, 2, 3, 4, 5.0), ("bad", 1) ])
+        self.assertEqual(count(), before)
+
+    def test_latest(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        now = time.time()
+        sqlite.add_records(now - 60, [ ("a", 1, 0, 0, 0, 0.0), ("b", 1, 0, 0, 0, 0.0) ])
+        sqlite.add_records(now, [ ("a", 2, 0, 0, 0, 0.0) ])
+        self.assertEqual(sqlite.db.execute("SELECT COUNT(*) FROM latest").fetchone()[0], 2)
+        self.assertEqual(sqlite.get_bundle_names(), ["a", "b"])
+        self.assertEqual(sqlite.get("a", "rss"), 2)
+        # "b" hasn't been updated for a minute
+        self.assertIsNone(sqlite.get("b", "rss"))
+        self.assertIsNone(sqlite.get("c", "rss"))
+        # values of the previous cycle are still served until the next one
+        # is stored, however long collecting it takes
+        sqlite.add_records(now - sample_interval - 5, [ ("c", 3, 0, 0, 0, 0.0) ])
+        self.assertEqual(sqlite.get("c", "rss"), 3)
+
+    def test_get_all(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        now = time.time()
+        self.assertEqual(sqlite.get_all(("rss",)), (None, {}))
+        sqlite.add_records(now - 60, [ ("a", 1, 0, 0, 0, 0.0), ("b", 1, 0, 0, 0, 0.0) ])
+        self.assertEqual(sqlite.get_all(("rss",)), (int(now - 60), {}))
+        sqlite.add_records(now, [ ("a", 2, 3, 4, 5, 6.0) ])
+        self.assertEqual(sqlite.get_all(("rss", "ctx_vol", "pcpu")),
+                (int(now), { "a": { "rss": 2, "ctx_vol": 4, "pcpu": 6.0 } }))
+
+    def test_prune_cycles(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        now = time.time()
+        for i in range(10):
+            rows = [ ("a", i, 0, 0, 0, 0.0) ] + ([ ("b", i, 0, 0, 0, 0.0) ] if i < 3 else [])
+            sqlite.add_records(now - 30 * (10 - i), rows)
+        # no trigger deletes rows behind our back
+        self.assertEqual(sqlite.db.execute("SELECT COUNT(*) FROM samples").fetchone()[0], 13)
+        self.assertEqual(sqlite.prune(max_cycles=4), 6)
+        rss = lambda name: [ r[0] for r in sqlite.db.execute(
+            "SELECT rss FROM samples JOIN bundles ON bundles.id = bundle_id"
+            " WHERE name=? ORDER BY ts", (name,)) ]
+        self.assertEqual(rss("a"), [6, 7, 8, 9])
+        self.assertEqual(rss("b"), [0, 1, 2])
+
+    def test_prune_age(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        now = time.time()
+        sqlite.add_records(now - 3600, [ ("a", 1, 0, 0, 0, 0.0), ("b", 1, 0, 0, 0, 0.0) ])
+        sqlite.add_records(now, [ ("a", 2, 0, 0, 0, 0.0) ])
+        self.assertEqual(sqlite.prune(max_age=600), 2)
+        self.assertEqual(sqlite.get_bundle_names(), ["a"])
+        self.assertEqual(sqlite.prune(max_age=600, max_cycles=1), 0)
+
+    def test_migrate_v0(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        now = int(time.time())
+        with tempfile.TemporaryDirectory() as tmp:
+            dbpath = os.path.join(tmp, "zaggregator.sqlite")
+            old = sqlite3.connect(dbpath)
+            old.executescript("""
+                CREATE TABLE samples (ts DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    name TEXT, rss INT, vms INT, ctxvol INT, ctxinvol INT, pcpu REAL);
+                CREATE TRIGGER DELETE_TAIL AFTER INSERT ON samples BEGIN SELECT 1; END;
+                CREATE TABLE latest (name TEXT PRIMARY KEY, ts INT, rss INT,
+                    vms INT, ctxvol INT, ctxinvol INT, pcpu REAL);
+                """)
+            for i, ts in enumerate((now - 60, now - 30)):
+                old.execute("INSERT INTO samples VALUES (?, ?, ?, 0, 0, 0, 0.0)",
+                    (time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts)), "it's", i))
+            old.execute("INSERT INTO latest VALUES (?, ?, 1, 0, 0, 0, 0.0)", ("it's", now))
+            old.commit()
+            old.close()
+
+            sqlite.db.close()
+            sqlite.__init__(dbpath)
+            version = sqlite.db.execute("PRAGMA user_version").fetchone()[0]
+            self.assertEqual(version, sqlite.SCHEMA_VERSION)
+            self.assertEqual(sqlite.db.execute(
+                "SELECT name, first_seen, last_seen FROM bundles").fetchall(),
+                [ ("it's", now - 60, now) ])
+            self.assertEqual(sqlite.db.execute(
+                "SELECT bundle_id, ts, rss FROM samples ORDER BY ts").fetchall(),
+                [ (1, now - 60, 0), (1, now - 30, 1) ])
+            self.assertEqual(sqlite.get("it's", "rss"), 1)
+            self.assertEqual(sqlite.get_bundle_names(max_age=60), [ "it's" ])
+            sqlite.add_records(now + 30, [ ("it's", 2, 0, 0, 0, 0.0) ])
+            self.assertEqual(sqlite.get("it's", "rss"), 2)
+            # already migrated
+            sqlite.db.close()
+            sqlite.__init__(dbpath)
+            self.assertEqual(sqlite.db.execute("SELECT COUNT(*) FROM samples").fetchone()[0], 3)
+
+
+def read_loop(dbpath, stop, errors):
+    """ zcheck-like reader, counts lock errors until stopped """
+    conn = sqlite.connect(dbpath, readonly=True)
+    sqlite.db = conn
+    nerrors = 0
+    while not stop.is_set():
+        try:
+            sqlite.get_bundle_names()
+            sqlite.get("bundle0", "rss")
+        except sqlite3.OperationalError:
+            nerrors += 1
+    conn.close()
+    errors.put(nerrors)
+
+class TestSqliteConcurrency(tests.TestCase):
+
+    def test_parallel_readers(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        nreaders, duration = 50, 2.0
+        with tempfile.TemporaryDirectory() as tmp:
+            dbpath = os.path.join(tmp, "zaggregator.sqlite")
+            sqlite.connect(dbpath).close()
+            errors, stop = multiprocessing.Queue(), multiprocessing.Event()
+            readers = [ multiprocessing.Process(target=read_loop,
+                args=(dbpath, stop, errors)) for _ in range(nreaders) ]
+            [ p.start() for p in readers ]
+            deadline = time.time() + duration
+
+            writer = sqlite.connect(dbpath)
+            db, sqlite.db = sqlite.db, writer
+            try:
+                cycles = 0
+                while time.time() < deadline:
+                    sqlite.add_records(time.time(), [ ("bundle{}".format(i),
+                        cycles, 0, 0, 0, 0.0) for i in range(20) ])
+                    sqlite.prune(max_cycles=10)
+                    cycles += 1
+            finally:
+                stop.set()
+                sqlite.db = db
+                writer.close()
+            nerrors = sum(errors.get(timeout=30) for _ in readers)
+            [ p.join() for p in readers ]
+        self.assertTrue(cycles > 0)
+        self.assertEqual(nerrors, 0)
+
+
 if __name__ == '__main__':
     run_test_module_by_name(__file__)
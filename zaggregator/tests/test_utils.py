@@ -66,6 +66,20 @@ class TestZaggregatorUtils(tests.TestCase):
             for i in range(len(fuzzy_strings)-1):
                 self.assertTrue(utils.fuzzy_match(*fuzzy_strings[i:i+2]))
 
+    def test_fuzzy_match_equivalence(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        pairs = tests.fuzzy_pairs(self.fuzzy_string_sets + self.fuzzy_string_sets_nomatch, 2000)
+        pairs += [ ("", "a"), ("abc", "abc"), ("aba", "abxaba"), ("ab", "ba") ]
+        utils._fuzzy_match.cache_clear()
+        for threshold in (utils.DEFAULT_FUZZY_THRESHOLD, 90):
+            for a, b in pairs:
+                self.assertEqual(utils.fuzzy_match(a, b, threshold),
+                        fuzz.partial_ratio(a, b) > threshold, (a, b, threshold))
+        # decided by common prefix or left to partial_ratio
+        self.assertTrue(utils.fuzzy_prefilter("php-fpm: pool main", "php-fpm: pool www", 53))
+        self.assertIsNone(utils.fuzzy_prefilter("postgres: checkpointer process",
+            "postgres: autovacuum launcher process", 53))
+
     def test_fuzzy_namesearch(self):
         logging.debug("======= %s ======" % inspect.stack()[0][3])
         r = []
@@ -79,6 +93,15 @@ class TestZaggregatorUtils(tests.TestCase):
 
         self.assertTrue(r == r1)
 
+    def test_reduce_sequence_pairwise(self):
+        logging.debug("======= %s ======" % inspect.stack()[0][3])
+        for s in self.fuzzy_string_sets:
+            self.assertEqual(utils.reduce_sequence(s), utils.reduce_sequence_pairwise(s))
+            self.assertEqual(utils.reduce_sequence(list(reversed(s))), utils.reduce_sequence(s))
+        # no common prefix
+        seq = [ "YK1UYU2C: child#0", "LCAR8XLT: child#1" ]
+        self.assertEqual(utils.reduce_sequence(seq), utils.reduce_sequence_pairwise(seq))
+
     def test_is_proc_group_parent(self):
         logging.debug("======= %s ======" % inspect.stack()[0][3])
         bname = "unittests"
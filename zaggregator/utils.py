@@ -2,25 +2,36 @@
 
 from difflib import SequenceMatcher
 from fuzzywuzzy import fuzz, StringMatcher
-import os, sys
+from fuzzywuzzy import utils as fuzz_utils
+import functools
+import os
 import logging as log
 import psutil
-import json
 import zaggregator
+# re-exported for backward compatibility, zcheck imports them from output
+from zaggregator.output import eprint, discovery_json  # noqa: F401
+from zaggregator.config import fuzzy_cache_size
 
 DEFAULT_FUZZY_THRESHOLD = 53
 class ProcessGone(Exception): pass
 
-def eprint(*args, **kwargs):
+def reduce_sequence(seq:list) -> str:
     """
-        Wrapper around built-in `print' function which allow to print
-        into sys.stderr instead of sys.stdout
+        Reduce sequence of names to single name, their common prefix
     """
-    print(*args, file=sys.stderr, **kwargs)
+    if len(seq) == 1: return seq[0]
 
-def reduce_sequence(seq:list) -> str:
+    # linear, compares the lexicographically first and last names only
+    if seq:
+        stem = os.path.commonprefix(seq).strip("[]:- ")
+        if stem:
+            return stem
+    return reduce_sequence_pairwise(seq)
+
+def reduce_sequence_pairwise(seq:list) -> str:
     """
-        Reduce sequence of names to single name
+        Reduce sequence of names to single name by matching neighbours
+        until single one is left, for names without common prefix
     """
     if len(seq) == 1: return seq[0]
 
@@ -42,16 +53,58 @@ def reduce_sequence(seq:list) -> str:
 
     return sp[0].strip("[]:- ")
 
+@functools.lru_cache(maxsize=None)
+def _prefix_to_match(n:int, threshold:int) -> int:
+    """
+        Length of common prefix of strings, the shorter of which has `n'
+        characters, enough for partial_ratio to exceed `threshold'
+    """
+    k = 0
+    while k <= n and fuzz_utils.intr(100 * k / n) <= threshold:
+        k += 1
+    return k
+
+def fuzzy_prefilter(a:str, b:str, threshold:int):
+    """
+        Decides if fuzz.partial_ratio(a, b) > threshold without running
+        it, None if it can't. partial_ratio compares the shorter string
+        with windows of the longer one, so length ratio bounds nothing,
+        a short string inside a long one scores 100.
+    """
+    if a == b:
+        return 100 > threshold
+    if not a or not b:
+        return 0 > threshold
+    # common prefix is one of the matching blocks, the window aligned
+    # with a block of k characters scores at least k/n
+    k = _prefix_to_match(min(len(a), len(b)), threshold)
+    if a[:k] == b[:k]:
+        return True
+    return None
+
+@functools.lru_cache(maxsize=fuzzy_cache_size)
+def _fuzzy_match(a:str, b:str, threshold:int) -> bool:
+    """
+        Cached fuzzy_match() of two strings, siblings of the same
+        parents are compared each cycle
+    """
+    match = fuzzy_prefilter(a, b, threshold)
+    if match is None:
+        score = fuzz.partial_ratio(a, b)
+        log.debug("Fuzzy score: %s (%s,%s)", score, a, b)
+        match = score > threshold
+    return match
+
 def fuzzy_match(a:str, b:str, threshold=DEFAULT_FUZZY_THRESHOLD) -> bool:
     """
-        Checks if there a fussy match between two strings
+        Checks if there a fussy match between two strings, same as
+        fuzz.partial_ratio(a, b) > threshold
     """
+    if isinstance(a, str) and isinstance(b, str):
+        return _fuzzy_match(a, b, threshold)
     score = fuzz.partial_ratio(a,b)
-    log.debug("Fuzzy score: {} ({},{})".format(score, a, b))
-    if score > threshold:
-        return True
-    else:
-        return False
+    log.debug("Fuzzy score: %s (%s,%s)", score, a, b)
+    return score > threshold
 
 def fuzzy_sequence_match(seq:list) -> bool:
     """
@@ -134,13 +187,3 @@ def is_proc_similar_to(proc1, proc2) -> bool:
                 return True
     return False
 
-def discovery_json(names):
-    """
-        Returns bundle names in Zabbix autodiscovery JSON format
-    """
-    template = { "data" : [ ]}
-    for bn in names:
-        template["data"].append({ "{#PROCGROUP}": bn, })
-    template["data"].append({ "{#PROCGROUP}": 'idle', })
-    return json.dumps(template)
-